@@ -0,0 +1,3979 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @File Name: sparkle/__init__.py
+# @Author: Copyright (c) 2017-02-02 17:31:33 Gillett Hernandez
+# @Date:   2017-02-02 17:31:33
+# @Last Modified by:   Gillett Hernandez
+# @Last Modified time: 2017-02-24 00:01:53
+
+import re
+import asyncio
+from array import array
+from bisect import bisect_left, bisect_right
+from enum import Enum
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from contextlib import contextmanager
+from operator import add, sub, mul, truediv, mod
+
+div = truediv
+import copy
+import gc
+import inspect
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+import threading
+import timeit
+import zlib
+
+# token matchers
+_token_regexs = (
+    ("Whitespace", r"[ \t\r\n]+"),
+    ("Comment", r"/\*.*?\*/"),
+    ("Return", r"return(?![a-zA-Z0-9_$])"),
+    ("Let", r"let(?![a-zA-Z0-9_$])"),
+    ("Fn", r"fn(?![a-zA-Z0-9_$])"),
+    ("Integer", r"[0-9]+"),
+    ("Ident", r"[a-zA-Z_$][a-zA-Z0-9_$]*"),
+    ("Comma", r","),
+    ("LParen", r"\("),
+    ("RParen", r"\)"),
+    ("LBrace", r"{"),
+    ("RBrace", r"}"),
+    ("Semicolon", r";"),
+    ("Function", r"->"),
+    ("Plus", r"\+"),
+    ("Minus", r"-"),
+    ("Times", r"\*"),
+    ("Divide", r"/"),
+    ("Modulo", r"%"),
+    ("Assign", r"="),
+    ("EOF", r"$"),
+)
+token_regexs = dict(_token_regexs)
+
+# language grammer
+# start      ::= statement*
+# statement  ::= expression ';'?
+#            ::= 'return' expression  ';'?
+#            ::= 'let' identifier '=' expression ';'?
+#            ::= '{' statement* '}'
+# expression ::= assignment
+#            ::= 'fn' '(' (identifier (',' identifier)*)? ')' -> statement
+# assignment ::= additive ('=' expression)*
+# additive   ::= multiply (('+'|'-') multiply)*
+# multiply   ::= postfix (('*'|'/'|'%') postfix)*
+# postfix    ::= terminal
+#            ::= terminal '(' (expression (',' expression)*)? ')'
+# terminal   ::= integer
+#            ::= identifier
+#            ::= '(' expression ')'
+# integer    ::= [0-9]+
+# identifier ::= [a-zA-Z_$][a-zA-Z0-9_$]*
+
+
+# tokens
+class T(Enum):
+    Root = "Start"
+    Whitespace = "Whitespace"
+    Comment = "Comment"
+    Return = "Return"
+    Arrow = "Arrow"
+    Let = "Let"
+    Fn = "Fn"
+    Integer = "Integer"
+    Ident = "Ident"
+    Comma = "Comma"
+    LParen = "LParen"
+    RParen = "RParen"
+    LBrace = "LBrace"
+    RBrace = "RBrace"
+    Semicolon = "Semicolon"
+    Function = "Function"
+    Plus = "Plus"
+    Minus = "Minus"
+    Times = "Times"
+    Divide = "Divide"
+    Modulo = "Modulo"
+    Assign = "Assign"
+    EOF = "EOF"
+    OP = "operator"
+    FCALL = "FunctionCall"
+    Assignment = "Assignment"
+    Block = "BlockStatement"
+
+
+optranslation = {T.Plus: add, T.Minus: sub, T.Times: mul, T.Divide: div, T.Modulo: mod}
+
+# every token matcher in one pattern, compiled once, tokens are told apart by the name of the group that matched
+token_pattern = re.compile("|".join("(?P<{}>{})".format(k, v) for k, v in _token_regexs))
+
+# token kind for each group of token_pattern, None for text that is skipped
+token_kinds = {k: (None if k in ("Whitespace", "Comment") else T[k]) for k, _ in _token_regexs}
+
+# the fields of the tuples yielded by tokenize, which are plain tuples since they are made once per token
+Token = namedtuple("Token", ["kind", "text", "pos", "line", "col"])
+
+
+def tokenize(source):
+    """Lazily turns source into (kind, text, pos, line, col) tuples as described by Token, ending with an EOF token.
+    source is either a string or an iterable of strings such as an open file, which is lexed one
+    complete line at a time so memory stays bounded by the longest line rather than the whole source"""
+    state = [0, 1, 0]  # offset of the text being lexed, line number, offset of the start of that line
+    if isinstance(source, str):
+        yield from _lex(source, state)
+    else:
+        pending = ""
+        for chunk in source:
+            pending += chunk
+            # no token spans a newline, so everything up to the last one can be lexed now
+            cut = pending.rfind("\n") + 1
+            if cut:
+                yield from _lex(pending[:cut], state)
+                pending = pending[cut:]
+        yield from _lex(pending, state)
+    offset, line, line_start = state
+    yield (T.EOF, "", offset, line, offset - line_start)
+
+
+def position(code, pos):
+    """1-based line and column of offset pos in code"""
+    return code.count("\n", 0, pos) + 1, pos - code.rfind("\n", 0, pos)
+
+
+def _lex(text, state):
+    offset, line, line_start = state
+    pos = 0
+    kinds = token_kinds
+    for match in token_pattern.finditer(text):
+        start = match.start()
+        if start != pos:
+            col = offset + pos - line_start
+            raise SyntaxError(
+                "Unexpected character {!r} at line {} column {}".format(text[pos], line, col + 1),
+                ("<sparkle>", line, col + 1, None),
+            )
+        pos = match.end()
+        group = match.lastgroup
+        kind = kinds[group]
+        if kind is None:
+            newlines = match.group().count("\n")
+            if newlines:
+                line += newlines
+                line_start = offset + start + match.group().rfind("\n") + 1
+        elif kind is not T.EOF:
+            yield (kind, match.group(), offset + start, line, offset + start - line_start)
+    if pos != len(text):
+        col = offset + pos - line_start
+        raise SyntaxError(
+            "Unexpected character {!r} at line {} column {}".format(text[pos], line, col + 1),
+            ("<sparkle>", line, col + 1, None),
+        )
+    state[:] = [offset + len(text), line, line_start]
+
+opcodes = {"+": "AD", "-": "SU", "*": "MU", "/": "DI", "imm": "IM", "arg": "AR"}
+
+
+# Identifier.depth of names that live in the global frame
+GLOBAL = -1
+
+# returned by blocks that finish without reaching a return statement
+NORETURN = type("NoReturn", (object,), {"__repr__": (lambda self: "NORETURN")})()
+
+
+def opfunc(op):
+    return [add, sub, mul, div, mod]["+-*/%".index(op.token)]
+
+
+# vm opcodes, every instruction is an (opcode, argument) pair of ints in a flat array:
+# LOAD_CONST n    push constants[n]
+# LOAD_LOCAL n    push slot n of the current frame
+# LOAD_GLOBAL n   push slot n of the global frame
+# LOAD_DEREF n    push slot (n & DEREF_MASK) of the frame (n >> DEREF_SHIFT) links up from the current one
+# STORE_LOCAL n   pop the top of the stack into slot n of the current frame
+# STORE_GLOBAL n  pop the top of the stack into slot n of the global frame
+# STORE_DEREF n   pop the top of the stack into a slot of an enclosing frame, as in LOAD_DEREF
+# DUP_TOP         push the top of the stack again
+# POP_TOP         discard the top of the stack
+# ADD .. MOD      pop b, pop a, push a op b
+# CALL n          pop n arguments and a closure, then jump into the closure's function with a new frame
+# TAIL_CALL n     as CALL, but the new frame replaces the current one instead of returning to it
+# RETURN_VALUE    pop the return value and resume the caller, or halt in the global scope
+# MAKE_CLOSURE n  push a closure of the function constants[n] over the current frame
+LOAD_CONST = 0
+LOAD_LOCAL = 1
+LOAD_GLOBAL = 2
+LOAD_DEREF = 3
+STORE_LOCAL = 4
+STORE_GLOBAL = 5
+STORE_DEREF = 6
+DUP_TOP = 7
+POP_TOP = 8
+ADD = 9
+SUB = 10
+MUL = 11
+DIV = 12
+MOD = 13
+CALL = 14
+RETURN_VALUE = 15
+MAKE_CLOSURE = 16
+TAIL_CALL = 17
+
+opnames = [
+    "LOAD_CONST",
+    "LOAD_LOCAL",
+    "LOAD_GLOBAL",
+    "LOAD_DEREF",
+    "STORE_LOCAL",
+    "STORE_GLOBAL",
+    "STORE_DEREF",
+    "DUP_TOP",
+    "POP_TOP",
+    "ADD",
+    "SUB",
+    "MUL",
+    "DIV",
+    "MOD",
+    "CALL",
+    "RETURN_VALUE",
+    "MAKE_CLOSURE",
+    "TAIL_CALL",
+]
+
+DEREF_SHIFT = 20
+DEREF_MASK = (1 << DEREF_SHIFT) - 1
+
+binary_opcodes = {T.Plus: ADD, T.Minus: SUB, T.Times: MUL, T.Divide: DIV, T.Modulo: MOD}
+
+
+class Node(object):
+    __slots__ = ["op", "token", "ti"]
+
+    def __init__(self, optype, token="", ti=0):
+        self.op = optype
+        self.token = token
+        self.ti = ti
+
+    # def __repr__(self):
+    #     # print("node repr")
+    #     if hasattr(self, 'n'):
+    #         string2 = ", 'n': {}".format(self.n)
+    #     elif hasattr(self, 'a') and hasattr(self, 'b'):
+    #         string2 = ", 'a': {0!r}, 'b': {1!r}".format(self.a, self.b)
+    #     elif any(e not in Node.__slots__ for e in self.__slots__):
+    #         string2 = ", " + ", ".join("'{}': '{}'".format(k, getattr(self, k)) for k in self.__slots__)
+    #     else:
+    #         string2 = ""
+    #     string2 += ", 'token': '{}'".format(self.token)
+    #     # print("op = ",self.op)
+    #     # print("string2 = ", string2)
+    #     rstring = "'op': '{0}'{1}".format(self.op, string2)
+    #     rstring = "{" + rstring + "}"
+    #     return rstring
+
+    def run():
+        raise NotImplementedError()
+
+    def __str__(self):
+        return "<{}>".format(self.token)
+
+    def __repr__(self):
+        return "<{}>".format(self.token)
+
+
+class Root(Node):
+    __slots__ = ["statements", "spans", "nslots", "symbols", "free"]
+
+    def __init__(self, statements=None):
+        super(Root, self).__init__(T.Root)
+        self.statements = statements
+        # filled in by the Parser, the (start, end) offsets in the source of every statement, see Parser.reparse
+        self.spans = []
+        # filled in by the Resolver, the size of the global frame, the slot of every global name
+        # and the globals that are used but never defined, which the host has to bind
+        self.nslots = 0
+        self.symbols = {}
+        self.free = []
+
+    def visit(self, visitor):
+        if isinstance(visitor, AstPrinter):
+            return visitor.parenthesize(self.op, *self.statements)
+        elif isinstance(visitor, BytecodeCompiler):
+            for statement in self.statements:
+                visitor.statement(statement)
+            visitor.emit(LOAD_CONST, visitor.constant(None))
+            visitor.emit(RETURN_VALUE)
+        elif isinstance(visitor, Resolver):
+            visitor.push_function()
+            for statement in self.statements:
+                statement.visit(visitor)
+            self.symbols = dict(visitor.functions[0][0])
+            self.free = visitor.free_globals()
+            self.nslots = visitor.pop_function()
+        elif isinstance(visitor, PythonCompiler):
+            # the globals are locals of run, unpacked from the global frame
+            visitor.emit(", ".join(["_"] + ["v0_{}".format(slot) for slot in range(1, self.nslots + 1)]) + ", = g")
+            for statement in self.statements:
+                visitor.statement(statement)
+            visitor.emit("return None")
+        elif isinstance(visitor, ClosureCompiler):
+            return visitor.block(self.statements, None)
+        elif isinstance(visitor, Optimizer):
+            self.statements = [statement.visit(visitor) for statement in self.statements]
+            return self
+
+    def run(self, interpreter):
+        rval = run_statements(self.statements, interpreter)
+        if type(rval) is TailCall:
+            return call(interpreter, rval.callee, rval.args)
+        return None if rval is NORETURN else rval
+
+
+class ReturnStatement(Node):
+    """Return statements return the expressions value to the callee's scope, or exit the program if used in the global scope"""
+
+    __slots__ = ["expression"]
+
+    def __init__(self, expression=None):
+        super(ReturnStatement, self).__init__(T.Return)
+        self.expression = expression
+
+    def visit(self, visitor):
+        if isinstance(visitor, AstPrinter):
+            return visitor.parenthesize("RT", self.expression)
+        elif isinstance(visitor, BytecodeCompiler):
+            visitor.tail(self.expression)
+        elif isinstance(visitor, Resolver):
+            self.expression.visit(visitor)
+        elif isinstance(visitor, PythonCompiler):
+            visitor.emit("return " + visitor.tail(self.expression))
+        elif isinstance(visitor, ClosureCompiler):
+            return visitor.tail(self.expression)
+        elif isinstance(visitor, Optimizer):
+            self.expression = self.expression.visit(visitor)
+            return self
+
+    def run(self, interpreter):
+        if self.expression.op is T.FCALL:
+            # a call in tail position is left to the caller's trampoline, see Function.enter
+            return self.expression.tail_run(interpreter)
+        return self.expression.run(interpreter)
+
+
+class LetStatement(Node):
+    """Let statements instantiate a variable and put it in the local scope"""
+
+    __slots__ = ["identifier", "expression"]
+
+    def __init__(self, identifier=None, expression=None):
+        super(LetStatement, self).__init__(T.Let)
+        self.identifier = identifier
+        self.expression = expression
+
+    def visit(self, visitor):
+        if isinstance(visitor, AstPrinter):
+            return visitor.parenthesize(
+                "{} =".format(visitor.tostring(self.identifier)), self.expression
+            )
+        elif isinstance(visitor, BytecodeCompiler):
+            self.expression.visit(visitor)
+            visitor.store(self.identifier)
+        elif isinstance(visitor, Resolver):
+            if isinstance(self.expression, Function):
+                # declared first so the function can call itself
+                visitor.declare(self.identifier)
+                self.expression.name = self.identifier.identifier
+                self.expression.visit(visitor)
+            else:
+                self.expression.visit(visitor)
+                visitor.declare(self.identifier)
+        elif isinstance(visitor, PythonCompiler):
+            value = self.expression.visit(visitor)
+            visitor.emit("{} = {}".format(visitor.variable(self.identifier), value))
+        elif isinstance(visitor, ClosureCompiler):
+            return visitor.store(self.identifier, self.expression.visit(visitor))
+        elif isinstance(visitor, Optimizer):
+            self.expression = self.expression.visit(visitor)
+            return self
+
+    def run(self, interpreter):
+        # -SCOPEMARK-
+        interpreter.frame[self.identifier.slot] = self.expression.run(interpreter)
+
+
+class BlockStatement(Node):
+    """Block statements start a new scope, its variables get their own slots in the enclosing frame"""
+
+    __slots__ = ["statements"]
+
+    def __init__(self, statements=None):
+        if statements == None:
+            statements = []
+        super(BlockStatement, self).__init__(T.Block)
+        self.statements = statements
+
+    def visit(self, visitor):
+        if isinstance(visitor, AstPrinter):
+            return visitor.parenthesize(self.op, *self.statements)
+        elif isinstance(visitor, BytecodeCompiler):
+            for statement in self.statements:
+                visitor.statement(statement)
+        elif isinstance(visitor, Resolver):
+            visitor.push_block([statement.identifier for statement in self.statements if statement.op is T.Let])
+            for statement in self.statements:
+                statement.visit(visitor)
+            visitor.pop_block()
+        elif isinstance(visitor, PythonCompiler):
+            for statement in self.statements:
+                visitor.statement(statement)
+        elif isinstance(visitor, ClosureCompiler):
+            return visitor.block(self.statements, NORETURN)
+        elif isinstance(visitor, Optimizer):
+            self.statements = [statement.visit(visitor) for statement in self.statements]
+            return self
+
+    def run(self, interpreter):
+        """returns NORETURN when control falls off the end of the block"""
+        # -SCOPEMARK-
+        return run_statements(self.statements, interpreter)
+
+
+class Assignment(Node):
+    __slots__ = ["lhs", "rhs"]
+
+    def __init__(self, lhs=None, rhs=None):
+        super(Assignment, self).__init__(T.Assignment)
+        self.lhs = lhs
+        self.rhs = rhs
+
+    def visit(self, visitor):
+        if isinstance(visitor, AstPrinter):
+            return visitor.parenthesize(self.op, self.lhs, self.rhs)
+        elif isinstance(visitor, BytecodeCompiler):
+            if not isinstance(self.lhs, Identifier):
+                raise RuntimeError("Invalid assignment target " + AstPrinter().tostring(self.lhs))
+            self.rhs.visit(visitor)
+            visitor.emit(DUP_TOP)
+            visitor.store(self.lhs)
+        elif isinstance(visitor, Resolver):
+            if not isinstance(self.lhs, Identifier):
+                raise RuntimeError("Invalid assignment target " + AstPrinter().tostring(self.lhs))
+            self.rhs.visit(visitor)
+            visitor.assign(self.lhs)
+        elif isinstance(visitor, PythonCompiler):
+            if not isinstance(self.lhs, Identifier):
+                raise RuntimeError("Invalid assignment target " + AstPrinter().tostring(self.lhs))
+            value = self.rhs.visit(visitor)
+            return "({} := {})".format(visitor.variable(self.lhs, store=True), value)
+        elif isinstance(visitor, ClosureCompiler):
+            if not isinstance(self.lhs, Identifier):
+                raise RuntimeError("Invalid assignment target " + AstPrinter().tostring(self.lhs))
+            return visitor.store(self.lhs, self.rhs.visit(visitor))
+        elif isinstance(visitor, Optimizer):
+            self.rhs = self.rhs.visit(visitor)
+            return self
+
+    def run(self, interpreter):
+        # -SCOPEMARK-
+        value = self.rhs.run(interpreter)
+        self.lhs.set(interpreter, value)
+        return value
+
+
+class Function(Node):
+    """functions start a new frame with every call, the arguments are bound to the first slots of the frame"""
+
+    __slots__ = ["arguments", "statements", "nslots", "name", "pure"]
+
+    def __init__(self, arguments=None, statements=None):
+        super(Function, self).__init__(T.Function)
+        self.arguments = arguments
+        self.statements = statements
+        # filled in by the Resolver, the number of parameter and local slots in a frame of this function
+        # and the name of the variable it is bound to with let, if any
+        self.nslots = 0
+        self.name = None
+        # filled in by analyze_purity
+        self.pure = False
+        # self.internal_name = Function.getid()
+
+    def visit(self, visitor):
+        if isinstance(visitor, AstPrinter):
+            return visitor.parenthesize("F", self.arguments, self.statements)
+        elif isinstance(visitor, BytecodeCompiler):
+            visitor.emit(MAKE_CLOSURE, visitor.function(self))
+        elif isinstance(visitor, Resolver):
+            visitor.push_function()
+            for argument in self.arguments:
+                visitor.declare(argument)
+            self.statements.visit(visitor)
+            self.nslots = visitor.pop_function()
+        elif isinstance(visitor, PythonCompiler):
+            return visitor.function(self)
+        elif isinstance(visitor, ClosureCompiler):
+            return visitor.function(self)
+        elif isinstance(visitor, Optimizer):
+            self.statements = self.statements.visit(visitor)
+            return self
+
+    def run(self, interpreter):
+        if interpreter.profiler is not None:
+            interpreter.profiler.closures[self] += 1
+        return Closure(self, interpreter.frame)
+
+    def call(self, interpreter, env, args):
+        if len(args) != len(self.arguments):
+            raise TypeError("function takes {} arguments but {} were given".format(len(self.arguments), len(args)))
+        # -SCOPEMARK-
+        # slot 0 links to the frame the function was defined in, then the arguments, then the locals
+        frame = [env]
+        frame += args
+        frame += [None] * (self.nslots - len(args))
+        return self.enter(interpreter, frame)
+
+    def enter(self, interpreter, frame):
+        """runs the function in a frame laid out as call does it"""
+        caller = interpreter.frame
+        function = self
+        limits = interpreter.limits
+        profiler = interpreter.profiler
+        if limits is not None:
+            limits.enter(function.nslots)
+        # trampoline, a tail call returns a TailCall which is run here instead of deeper in the python stack
+        while True:
+            if profiler is not None:
+                profiler.calls[function] += 1
+            interpreter.frame = frame
+            body = function.statements
+            rval = body.tail_run(interpreter) if body.op is T.FCALL else body.run(interpreter)
+            if type(rval) is not TailCall:
+                break
+            callee, args = rval.callee, rval.args
+            if type(callee) is not Closure:
+                if not getattr(callee, "sparkle_pure", False):
+                    interpreter.impure_calls += 1
+                rval = callee(*args)
+                break
+            if limits is not None:
+                # a back edge of the trampoline, the frame is replaced rather than stacked
+                limits.replace(function.nslots, callee.function.nslots)
+            function = callee.function
+            if not function.pure:
+                interpreter.impure_calls += 1
+            if len(args) != len(function.arguments):
+                raise TypeError("function takes {} arguments but {} were given".format(len(function.arguments), len(args)))
+            frame = [callee.env]
+            frame += args
+            frame += [None] * (function.nslots - len(args))
+        if limits is not None:
+            limits.exit(function.nslots)
+        interpreter.frame = caller
+        return None if rval is NORETURN else rval
+
+
+class Op(Node):
+    __slots__ = ["a", "b", "opfunc"]
+
+    def __init__(self, optype, a, b):
+        super(Op, self).__init__(optype)
+        self.a = a
+        self.b = b
+        self.opfunc = optranslation[optype]
+
+    def visit(self, visitor):
+        if isinstance(visitor, AstPrinter):
+            return visitor.parenthesize(self.op, self.a, self.b)
+        elif isinstance(visitor, BytecodeCompiler):
+            self.a.visit(visitor)
+            self.b.visit(visitor)
+            visitor.emit(binary_opcodes[self.op])
+        elif isinstance(visitor, Resolver):
+            self.a.visit(visitor)
+            self.b.visit(visitor)
+        elif isinstance(visitor, PythonCompiler):
+            return "({} {} {})".format(self.a.visit(visitor), visitor.symbols[self.op], self.b.visit(visitor))
+        elif isinstance(visitor, ClosureCompiler):
+            return visitor.binary(self.opfunc, self.a, self.b)
+        elif isinstance(visitor, Optimizer):
+            return visitor.chain([self.a.visit(visitor), self.b.visit(visitor)], [self])
+
+    def run(self, interpreter):
+        return self.opfunc(self.a.run(interpreter), self.b.run(interpreter))
+
+
+class MultiExpressionNode(Node):
+    __slots__ = ["nodes", "ops"]
+
+    def __init__(self, nodes=[], ops=[]):
+        super(MultiExpressionNode, self).__init__("MultiExpression")
+        self.nodes = nodes
+        self.ops = ops
+
+    def visit(self, visitor):
+        if isinstance(visitor, AstPrinter):
+            s = "("
+            for node, op in zip(self.nodes, self.ops):
+                s += visitor.tostring(node)
+                s += " {}".format(str(op))
+            s += " "
+            s += visitor.tostring(self.nodes[-1])
+            s += ")"
+            return s
+        elif isinstance(visitor, BytecodeCompiler):
+            self.nodes[0].visit(visitor)
+            for node, op in zip(self.nodes[1:], self.ops):
+                node.visit(visitor)
+                visitor.emit(binary_opcodes[op.op])
+        elif isinstance(visitor, Resolver):
+            for node in self.nodes:
+                node.visit(visitor)
+        elif isinstance(visitor, PythonCompiler):
+            return visitor.chain(self.nodes, self.ops)
+        elif isinstance(visitor, ClosureCompiler):
+            return visitor.chain(self.nodes, self.ops)
+        elif isinstance(visitor, Optimizer):
+            return visitor.chain([node.visit(visitor) for node in self.nodes], self.ops)
+
+    def run(self, interpreter):
+        # type feedback, the first run looks at the operand types and swaps in the class of a handler for them,
+        # an int handler if they were all ints and the generic one otherwise
+        nodes = self.nodes
+        res = nodes[0].run(interpreter)
+        ints = True
+        for node, op in zip(nodes[1:], self.ops):
+            value = node.run(interpreter)
+            ints = ints and type(res) is int and type(value) is int
+            res = op.opfunc(res, value)
+        if ints:
+            self.__class__ = int_handlers.get(self.ops[0].op, IntChainNode) if len(nodes) == 2 else IntChainNode
+        else:
+            self.__class__ = GenericExpressionNode
+        return res
+
+    def deoptimize(self, interpreter, i, res, value):
+        """called by an int handler whose guard failed at operand i, with the value so far and that of operand i.
+        Goes on with the generic handler, for this and every later run, since the site has seen other types"""
+        self.__class__ = GenericExpressionNode
+        nodes, ops = self.nodes, self.ops
+        res = ops[i - 1].opfunc(res, value)
+        for i in range(i + 1, len(nodes)):
+            res = ops[i - 1].opfunc(res, nodes[i].run(interpreter))
+        return res
+
+
+class GenericExpressionNode(MultiExpressionNode):
+    """the handler for a MultiExpressionNode that has seen operands other than ints"""
+
+    __slots__ = []
+
+    def run(self, interpreter):
+        res = self.nodes[0].run(interpreter)
+        for node, op in zip(self.nodes[1:], self.ops):
+            res = op.opfunc(res, node.run(interpreter))
+        return res
+
+
+class IntChainNode(MultiExpressionNode):
+    """the int handler for a MultiExpressionNode of more than two operands"""
+
+    __slots__ = []
+
+    def run(self, interpreter):
+        nodes, ops = self.nodes, self.ops
+        res = nodes[0].run(interpreter)
+        for i in range(1, len(nodes)):
+            value = nodes[i].run(interpreter)
+            if type(res) is not int or type(value) is not int:
+                return self.deoptimize(interpreter, i, res, value)
+            op = ops[i - 1].op
+            if op is T.Plus:
+                res = res + value
+            elif op is T.Minus:
+                res = res - value
+            elif op is T.Times:
+                res = res * value
+            else:
+                res = ops[i - 1].opfunc(res, value)
+        return res
+
+
+class IntAddNode(MultiExpressionNode):
+    __slots__ = []
+
+    def run(self, interpreter):
+        a = self.nodes[0].run(interpreter)
+        b = self.nodes[1].run(interpreter)
+        if type(a) is int and type(b) is int:
+            return a + b
+        return self.deoptimize(interpreter, 1, a, b)
+
+
+class IntSubNode(MultiExpressionNode):
+    __slots__ = []
+
+    def run(self, interpreter):
+        a = self.nodes[0].run(interpreter)
+        b = self.nodes[1].run(interpreter)
+        if type(a) is int and type(b) is int:
+            return a - b
+        return self.deoptimize(interpreter, 1, a, b)
+
+
+class IntMulNode(MultiExpressionNode):
+    __slots__ = []
+
+    def run(self, interpreter):
+        a = self.nodes[0].run(interpreter)
+        b = self.nodes[1].run(interpreter)
+        if type(a) is int and type(b) is int:
+            return a * b
+        return self.deoptimize(interpreter, 1, a, b)
+
+
+class IntDivNode(MultiExpressionNode):
+    __slots__ = []
+
+    def run(self, interpreter):
+        a = self.nodes[0].run(interpreter)
+        b = self.nodes[1].run(interpreter)
+        if type(a) is int and type(b) is int:
+            # still true division, like every other backend
+            return a / b
+        return self.deoptimize(interpreter, 1, a, b)
+
+
+class IntModNode(MultiExpressionNode):
+    __slots__ = []
+
+    def run(self, interpreter):
+        a = self.nodes[0].run(interpreter)
+        b = self.nodes[1].run(interpreter)
+        if type(a) is int and type(b) is int:
+            return a % b
+        return self.deoptimize(interpreter, 1, a, b)
+
+
+# the int handlers of two operand expressions, by operator, longer chains and other operators get IntChainNode
+int_handlers = {T.Plus: IntAddNode, T.Minus: IntSubNode, T.Times: IntMulNode, T.Divide: IntDivNode, T.Modulo: IntModNode}
+
+
+# class Expression(Node):
+#     __slots__ = ['']
+
+
+class FCall(Node):
+    """Calls keep an inline cache of the last function they called and the plan for its frames,
+    the slots after the arguments. A call to that function again, in any closure, skips the arity check
+    and lays out the frame from the plan, anything else goes the long way and caches its function instead"""
+
+    __slots__ = ["fn", "args", "cache"]
+
+    def __init__(self, fn=None, args=None):
+        super(FCall, self).__init__(T.FCALL)
+        self.fn = fn
+        self.args = args
+        # (callee, plan) in one tuple, so a thread never sees the plan of another callee
+        self.cache = (None, ())
+
+    def visit(self, visitor):
+        if isinstance(visitor, AstPrinter):
+            return visitor.parenthesize("FC", self.fn, *self.args)
+        elif isinstance(visitor, BytecodeCompiler):
+            self.fn.visit(visitor)
+            for arg in self.args:
+                arg.visit(visitor)
+            visitor.emit(CALL, len(self.args))
+        elif isinstance(visitor, Resolver):
+            self.fn.visit(visitor)
+            for arg in self.args:
+                arg.visit(visitor)
+        elif isinstance(visitor, PythonCompiler):
+            # a callee that made a tail call returns a TailCall, settled here where the value is needed
+            return "settle({})".format(visitor.call(self))
+        elif isinstance(visitor, ClosureCompiler):
+            return visitor.call(self)
+        elif isinstance(visitor, Optimizer):
+            self.args = [arg.visit(visitor) for arg in self.args]
+            return self
+
+    def run(self, interpreter):
+        # -SCOPEMARK-
+        f = self.fn.run(interpreter)
+        callee, plan = self.cache
+        if type(f) is Closure and f.function is callee:
+            frame = [f.env]
+            for arg in self.args:
+                frame.append(arg.run(interpreter))
+            frame += plan
+            return callee.enter(interpreter, frame)
+        args = [arg.run(interpreter) for arg in self.args]
+        if type(f) is Closure:
+            function = f.function
+            if len(args) == len(function.arguments):
+                self.cache = (function, (None,) * (function.nslots - len(args)))
+            return function.call(interpreter, f.env, args)
+        elif callable(f):
+            # a python function bound by the host
+            return f(*args)
+        raise TypeError("{} is not a function".format(self.fn.identifier))
+
+    def tail_run(self, interpreter):
+        """evaluates the callee and arguments, leaving the call itself to the trampoline in Function.enter"""
+        f = self.fn.run(interpreter)
+        if type(f) is not Closure and not callable(f):
+            raise TypeError("{} is not a function".format(self.fn.identifier))
+        return TailCall(f, [arg.run(interpreter) for arg in self.args])
+
+
+class Constant(Node):
+    __slots__ = ["n"]
+
+    def __init__(self, n=None):
+        super(Constant, self).__init__(T.Integer)
+        self.n = n
+
+    def visit(self, visitor):
+        if isinstance(visitor, AstPrinter):
+            return str(self.n)
+        elif isinstance(visitor, BytecodeCompiler):
+            visitor.emit(LOAD_CONST, visitor.constant(self.n))
+        elif isinstance(visitor, Resolver):
+            pass
+        elif isinstance(visitor, PythonCompiler):
+            return repr(self.n)
+        elif isinstance(visitor, ClosureCompiler):
+            n = self.n
+            return lambda frame: n
+        elif isinstance(visitor, Optimizer):
+            return self
+
+    def run(self, interpreter):
+        return self.n
+
+
+class Identifier(Node):
+    """depth and slot are filled in by the Resolver.
+    depth counts the function frames to walk up from the current one, GLOBAL means the global frame"""
+
+    __slots__ = ["identifier", "depth", "slot"]
+
+    def __init__(self, identifier=None):
+        super(Identifier, self).__init__(T.Ident)
+        self.identifier = identifier
+        self.depth = 0
+        self.slot = 0
+
+    def visit(self, visitor):
+        if isinstance(visitor, AstPrinter):
+            return visitor.parenthesize("ID", self.identifier)
+        elif isinstance(visitor, BytecodeCompiler):
+            visitor.load(self)
+        elif isinstance(visitor, Resolver):
+            visitor.lookup(self)
+        elif isinstance(visitor, PythonCompiler):
+            return visitor.variable(self)
+        elif isinstance(visitor, ClosureCompiler):
+            return visitor.load(self)
+        elif isinstance(visitor, Optimizer):
+            return self
+
+    def run(self, interpreter):
+        # -SCOPEMARK-
+        depth = self.depth
+        if depth == 0:
+            return interpreter.frame[self.slot]
+        elif depth == GLOBAL:
+            return interpreter.globals[self.slot]
+        frame = interpreter.frame
+        while depth:
+            frame = frame[0]
+            depth -= 1
+        return frame[self.slot]
+
+    def set(self, interpreter, value):
+        depth = self.depth
+        if depth == 0:
+            frame = interpreter.frame
+        elif depth == GLOBAL:
+            frame = interpreter.globals
+        else:
+            frame = interpreter.frame
+            while depth:
+                frame = frame[0]
+                depth -= 1
+        frame[self.slot] = value
+
+
+class MemoizingFCall(FCall):
+    """FCall that memoizes calls to pure closures, swapped in for FCall on the tree run by Interpreter(memoize=True).
+    A result is only kept if nothing impure was called while computing it"""
+
+    __slots__ = []
+
+    def run(self, interpreter):
+        f = self.fn.run(interpreter)
+        args = [arg.run(interpreter) for arg in self.args]
+        if type(f) is Closure:
+            function = f.function
+            if not function.pure:
+                interpreter.impure_calls += 1
+                return function.call(interpreter, f.env, args)
+            memo = f.memo
+            if memo is None:
+                memo = f.memo = MemoCache(interpreter.memo_size)
+                interpreter.memo_caches.append((function, memo))
+            try:
+                # typed, so 2 and 2.0, which are equal, do not share a result that keeps the type of the argument
+                key = tuple(args) + tuple(type(arg) for arg in args)
+                value = memo.entries[key]
+            except KeyError:
+                memo.misses += 1
+            except TypeError:
+                # unhashable arguments from the host
+                return function.call(interpreter, f.env, args)
+            else:
+                memo.hits += 1
+                memo.entries.move_to_end(key)
+                return value
+            impure_calls = interpreter.impure_calls
+            value = function.call(interpreter, f.env, args)
+            # None is what a variable read before it is assigned holds, so it is not worth trusting
+            if interpreter.impure_calls == impure_calls and value is not None:
+                memo.entries[key] = value
+                if len(memo.entries) > memo.maxsize:
+                    memo.entries.popitem(last=False)
+            return value
+        elif callable(f):
+            if not getattr(f, "sparkle_pure", False):
+                interpreter.impure_calls += 1
+            return f(*args)
+        raise TypeError("{} is not a function".format(self.fn.identifier))
+
+
+class MemoCache:
+    """LRU cache of the results of one closure, keyed by its arguments and their types"""
+
+    __slots__ = ["entries", "maxsize", "hits", "misses"]
+
+    def __init__(self, maxsize):
+        self.entries = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+
+def pure(f):
+    """marks a python function bound with Interpreter.run as free of side effects, so memoized calls may use it"""
+    f.sparkle_pure = True
+    return f
+
+
+def analyze_purity(root):
+    """Sets Function.pure on every function of a resolved tree.
+    A function is pure if nothing in it, nested functions included, assigns to a variable from outside it,
+    no function nested in it assigns to one of its own variables, since it could return that state,
+    and every variable it reads from outside it is constant, bound once and never assigned.
+    A variable whose let comes after the function is only constant if nothing is called in between,
+    otherwise the function could run while it is still None.
+    Whether the functions it calls are pure is only known at runtime, see MemoizingFCall"""
+    writes = {}
+    assigned = set()
+    reads = {}
+    # the variables whose let has been walked, and for those that have not, the reads of them so far
+    # as (calls made where the variable lives at the time, the functions reading it)
+    defined = set()
+    early = defaultdict(list)
+    # function or root -> calls made right in its body so far, nested functions not included
+    calls = defaultdict(int)
+
+    def binding(identifier, stack):
+        if identifier.depth == GLOBAL:
+            return 0, (stack[0], identifier.slot)
+        index = len(stack) - 1 - identifier.depth
+        return index, (stack[index], identifier.slot)
+
+    def let(key):
+        writes[key] = writes.get(key, 0) + 1
+        defined.add(key)
+        for before, readers in early.pop(key, ()):
+            if calls[key[0]] != before:
+                for function in readers:
+                    reads[function].add(None)
+
+    def walk(node, stack):
+        if isinstance(node, Function):
+            reads[node] = set()
+            stack.append(node)
+            for argument in node.arguments:
+                let((node, argument.slot))
+            walk(node.statements, stack)
+            stack.pop()
+        elif isinstance(node, LetStatement):
+            _, key = binding(node.identifier, stack)
+            if isinstance(node.expression, Function):
+                # bound before the function can be called, so it can read itself
+                let(key)
+                walk(node.expression, stack)
+            else:
+                walk(node.expression, stack)
+                let(key)
+        elif isinstance(node, Assignment):
+            index, key = binding(node.lhs, stack)
+            assigned.add(key)
+            writers = stack[index + 1 :]
+            if writers and index > 0:
+                # the function that owns the variable could return the closure holding that state
+                writers = stack[index:]
+            # None stands for an assignment to an outer variable
+            for function in writers:
+                reads[function].add(None)
+            walk(node.rhs, stack)
+        elif isinstance(node, Identifier):
+            index, key = binding(node, stack)
+            readers = stack[index + 1 :]
+            for function in readers:
+                reads[function].add(key)
+            if readers and key not in defined:
+                early[key].append((calls[key[0]], readers))
+        else:
+            if isinstance(node, FCall):
+                calls[stack[-1]] += 1
+            for child in children(node):
+                walk(child, stack)
+
+    walk(root, [root])
+    for function, keys in reads.items():
+        function.pure = all(key is not None and key not in assigned and writes.get(key, 0) <= 1 for key in keys)
+    return root
+
+
+def vectorized(f):
+    """marks a python function bound with Interpreter.run_batch as working elementwise on numpy arrays,
+    so batches that call it can still be evaluated in one pass"""
+    f.sparkle_vectorized = True
+    return f
+
+
+class NotVectorizable(Exception):
+    """raised when a batch evaluated in one pass calls a host function that only takes single values"""
+
+
+def scalar_only(f):
+    """stands in for f during a one pass batch, see Interpreter.run_batch"""
+
+    def guard(*args):
+        raise NotVectorizable(f)
+
+    return guard
+
+
+class TailCall:
+    """a call in tail position, returned up to the nearest Function.enter instead of being made"""
+
+    __slots__ = ["callee", "args"]
+
+    def __init__(self, callee, args):
+        self.callee = callee
+        self.args = args
+
+
+class Closure:
+    """a function value, the function together with the frame it was defined in"""
+
+    __slots__ = ["function", "env", "memo"]
+
+    def __init__(self, function, env):
+        self.function = function
+        self.env = env
+        # MemoCache of the closure, made on its first memoized call
+        self.memo = None
+
+    def __repr__(self):
+        return "<Closure {!r}>".format(self.function)
+
+
+class LimitExceeded(Exception):
+    """raised when a run goes over one of its Limits. limit names the one that was exceeded and maximum is its value,
+    steps, depth and slots are the counters at that point"""
+
+    def __init__(self, limit, maximum, steps, depth, slots):
+        super(LimitExceeded, self).__init__(
+            "{} limit of {} exceeded (steps={}, depth={}, slots={})".format(limit, maximum, steps, depth, slots)
+        )
+        self.limit = limit
+        self.maximum = maximum
+        self.steps = steps
+        self.depth = depth
+        self.slots = slots
+
+
+class Limits:
+    """Caps on a run of an Interpreter, None for no cap.
+    Calls are the only way Sparkle repeats work, so they are where the counters are kept: steps counts calls,
+    tail calls included, depth counts the calls in progress and slots the variable slots of every live frame,
+    the global one included. Going over a cap raises LimitExceeded"""
+
+    __slots__ = ["max_steps", "max_depth", "max_slots", "steps", "depth", "slots"]
+
+    def __init__(self, max_steps=None, max_depth=None, max_slots=None):
+        self.max_steps = float("inf") if max_steps is None else max_steps
+        self.max_depth = float("inf") if max_depth is None else max_depth
+        self.max_slots = float("inf") if max_slots is None else max_slots
+        self.reset()
+
+    def __repr__(self):
+        return "<Limits steps={} depth={} slots={}>".format(self.steps, self.depth, self.slots)
+
+    def reset(self, slots=0):
+        self.steps = 0
+        self.depth = 0
+        self.slots = slots
+        if slots > self.max_slots:
+            self.exceeded("slots", self.max_slots)
+
+    def enter(self, nslots):
+        """a call that needs a frame of nslots"""
+        self.steps += 1
+        self.depth += 1
+        self.slots += nslots
+        if self.steps > self.max_steps:
+            self.exceeded("steps", self.max_steps)
+        if self.depth > self.max_depth:
+            self.exceeded("depth", self.max_depth)
+        if self.slots > self.max_slots:
+            self.exceeded("slots", self.max_slots)
+
+    def replace(self, old, new):
+        """a tail call, a frame of old slots gives way to one of new slots"""
+        self.steps += 1
+        self.slots += new - old
+        if self.steps > self.max_steps:
+            self.exceeded("steps", self.max_steps)
+        if self.slots > self.max_slots:
+            self.exceeded("slots", self.max_slots)
+
+    def exit(self, nslots):
+        self.depth -= 1
+        self.slots -= nslots
+
+    def exceeded(self, limit, maximum):
+        raise LimitExceeded(limit, maximum, self.steps, self.depth, self.slots)
+
+
+def call(interpreter, callee, args):
+    """calls a Sparkle closure, or a python function bound by the host"""
+    if type(callee) is Closure:
+        return callee.function.call(interpreter, callee.env, args)
+    return callee(*args)
+
+
+def run_statements(statements, interpreter):
+    """runs statements in order until one returns, returns NORETURN if none did"""
+    for statement in statements:
+        op = statement.op
+        if op is T.Return:
+            return statement.run(interpreter)
+        elif op is T.Block:
+            rval = statement.run(interpreter)
+            if rval is not NORETURN:
+                return rval
+        else:
+            statement.run(interpreter)
+    return NORETURN
+
+
+def children(node):
+    """the nodes directly below node, found through its __slots__"""
+    for cls in type(node).__mro__[:-2]:
+        for name in cls.__dict__.get("__slots__", ()):
+            value = getattr(node, name, None)
+            if isinstance(value, Node):
+                yield value
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, Node):
+                        yield item
+
+
+def count_nodes(root):
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(children(node))
+    return count
+
+
+def tree_nbytes(root):
+    """the memory held by the tree under root, its nodes, their lists and the strings and numbers in them"""
+    seen = set()
+    size = 0
+    stack = [root]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+        if isinstance(value, Node):
+            for cls in type(value).__mro__[:-2]:
+                for name in cls.__dict__.get("__slots__", ()):
+                    item = getattr(value, name, None)
+                    if isinstance(item, (Node, list, str, int, float)) and not isinstance(item, bool):
+                        stack.append(item)
+        elif isinstance(value, list):
+            stack.extend(value)
+    return size
+
+
+# the binary operators by token text, with the kind of their node and their binding power, higher binds tighter.
+# Parser.parse_binary works from this table alone, a new operator needs a token matcher, an entry here and one in optranslation
+binary_operators = {
+    "+": (T.Plus, 10),
+    "-": (T.Minus, 10),
+    "*": (T.Times, 20),
+    "/": (T.Divide, 20),
+    "%": (T.Modulo, 20),
+}
+
+# keyed by token text since every token is looked up while parsing and strings hash faster than enum members
+binding_powers = {text: power for text, (kind, power) in binary_operators.items()}
+
+# the operators that can be chained in one MultiExpressionNode without changing their meaning, those of one power
+precedence_groups = {kind: power for kind, power in binary_operators.values()}
+
+
+class Optimizer:
+    """Returns an AST with constant expressions reduced, run before the Resolver.
+    Chains are evaluated left to right, so only a leading run of constants is folded, operations that
+    would raise at runtime such as division by zero are left in place, and x*1, 1*x, x+0, 0+x and x-0
+    are reduced to x"""
+
+    def __init__(self):
+        self.before = 0
+        self.after = 0
+
+    def optimize(self, root):
+        self.before = count_nodes(root)
+        root = root.visit(self)
+        self.after = count_nodes(root)
+        return root
+
+    def chain(self, nodes, ops):
+        nodes = list(nodes)
+        ops = list(ops)
+        # (a + b) + c is a + b + c, only on the left since a - (b + c) is not a - b + c
+        first = nodes[0]
+        if isinstance(first, MultiExpressionNode) and all(
+            precedence_groups[op.op] == precedence_groups[ops[0].op] for op in first.ops
+        ):
+            nodes[:1] = first.nodes
+            ops[:0] = first.ops
+        # fold the leading constants
+        while len(nodes) > 1 and isinstance(nodes[0], Constant) and isinstance(nodes[1], Constant):
+            folded = self.fold(ops[0], nodes[0].n, nodes[1].n)
+            if folded is None:
+                break
+            # where the folded expression started, for the lines of Profiler
+            folded.ti = nodes[0].ti
+            nodes[:2] = [folded]
+            del ops[0]
+        # identities
+        i = 1
+        while i < len(nodes):
+            node, op = nodes[i], ops[i - 1].op
+            if isinstance(node, Constant) and (
+                (op is T.Times and node.n == 1) or (op in (T.Plus, T.Minus) and node.n == 0)
+            ) and type(node.n) is int:
+                del nodes[i]
+                del ops[i - 1]
+            else:
+                i += 1
+        if len(nodes) > 1 and isinstance(nodes[0], Constant) and type(nodes[0].n) is int:
+            if (ops[0].op is T.Times and nodes[0].n == 1) or (ops[0].op is T.Plus and nodes[0].n == 0):
+                del nodes[0]
+                del ops[0]
+        if len(nodes) == 1:
+            return nodes[0]
+        return MultiExpressionNode(nodes, ops)
+
+    def fold(self, op, a, b):
+        if op.op in (T.Divide, T.Modulo) and b == 0:
+            return None
+        node = Constant(optranslation[op.op](a, b))
+        node.token = str(node.n)
+        return node
+
+
+class Resolver:
+    """Assigns every identifier a (depth, slot) pair and sizes every frame.
+    Blocks get fresh slots in the frame of their enclosing function, so only functions create frames.
+    Names that are not found in any enclosing scope refer to the global frame"""
+
+    def __init__(self):
+        # one entry per enclosing function, each a list of block scopes mapping names to slots
+        self.functions = []
+        # the next free slot of every enclosing function's frame, slot 0 is the link to the defining frame
+        self.nslots = []
+        # parallel to functions, the names of every block scope that have a slot before their let is reached,
+        # so functions defined earlier in the block can refer to them
+        self.hoisted = []
+        self.declared = set()
+        self.referenced = set()
+
+    def resolve(self, root):
+        root.visit(self)
+        return root
+
+    def push_function(self):
+        self.functions.append([{}])
+        self.hoisted.append([set()])
+        self.nslots.append(1)
+
+    def pop_function(self):
+        self.functions.pop()
+        self.hoisted.pop()
+        return self.nslots.pop() - 1
+
+    def push_block(self, lets=()):
+        """opens a block scope in which the identifiers of lets are declared up front"""
+        self.functions[-1].append({})
+        self.hoisted[-1].append(set())
+        for identifier in lets:
+            name = identifier.identifier
+            if name not in self.functions[-1][-1]:
+                self.allocate(name)
+                self.hoisted[-1][-1].add(name)
+
+    def pop_block(self):
+        self.functions[-1].pop()
+        self.hoisted[-1].pop()
+
+    def declare(self, identifier):
+        name = identifier.identifier
+        if len(self.functions) == 1 and len(self.functions[0]) == 1:
+            # a global, which may already have a slot from an earlier use inside a function
+            self.declared.add(name)
+            slot = self.functions[0][0].get(name)
+            if slot is None:
+                slot = self.allocate(name)
+        elif name in self.hoisted[-1][-1]:
+            self.hoisted[-1][-1].remove(name)
+            slot = self.functions[-1][-1][name]
+        else:
+            slot = self.allocate(name)
+        identifier.depth = 0
+        identifier.slot = slot
+
+    def allocate(self, name):
+        slot = self.nslots[-1]
+        self.nslots[-1] += 1
+        self.functions[-1][-1][name] = slot
+        return slot
+
+    def find(self, identifier):
+        name = identifier.identifier
+        innermost = len(self.functions) - 1
+        for depth in range(innermost, -1, -1):
+            for scope, hoisted in zip(reversed(self.functions[depth]), reversed(self.hoisted[depth])):
+                # a name whose let is still to come is only seen from inside functions, which run later
+                if name in scope and not (depth == innermost and name in hoisted):
+                    if depth == innermost:
+                        identifier.depth = 0
+                    elif depth == 0:
+                        identifier.depth = GLOBAL
+                    else:
+                        identifier.depth = innermost - depth
+                    identifier.slot = scope[name]
+                    return True
+        return False
+
+    def lookup(self, identifier):
+        if not self.find(identifier):
+            # not defined yet, a global that has to be declared somewhere in the global scope
+            name = identifier.identifier
+            globals_ = self.functions[0][0]
+            globals_[name] = slot = self.nslots[0]
+            self.nslots[0] += 1
+            identifier.depth = 0 if len(self.functions) == 1 else GLOBAL
+            identifier.slot = slot
+        self.referenced.add(identifier.identifier)
+
+    def assign(self, identifier):
+        if not self.find(identifier):
+            # assigning an unknown name declares it in the current scope
+            self.declare(identifier)
+
+    def free_globals(self):
+        globals_ = self.functions[0][0]
+        return sorted(name for name in self.referenced if name in globals_ and name not in self.declared)
+
+
+Ref = type("Ref", (object,), {"i": 0, "__repr__": (lambda self: "<Ref i={}>".format(self.i))})
+
+
+class AstPrinter:
+    def tostring(self, expression):
+        """handles Root, Block, Multiexpression, anything with attribute 'n',\nanything with attributes ('a', 'b')"""
+        if isinstance(expression, Node):
+            return expression.visit(self)
+        elif isinstance(expression, (list, tuple)):
+            return self.parenthesize("L", *expression)
+        elif isinstance(expression, str):
+            return expression
+        elif expression is None:
+            return "NULLE"
+        else:
+            raise RuntimeError("Unaccounted for expression " + str(locals()))
+
+    def parenthesize(self, optype, *args):
+        s = "(" + str(optype)
+        for node in args:
+            s += " "
+            s += self.tostring(node)
+        s += ")"
+        return s
+
+
+# builds the node the parser starts from for each group of token_pattern, groups that are not here are skipped
+token_nodes = {
+    "Return": lambda text: ReturnStatement(None),
+    "Let": lambda text: LetStatement(None),
+    "Fn": lambda text: Function(None),
+    "Integer": lambda text: Constant(int(text)),
+    "Ident": Identifier,
+    "Plus": lambda text: Op(T.Plus, None, None),
+    "Minus": lambda text: Op(T.Minus, None, None),
+    "Times": lambda text: Op(T.Times, None, None),
+    "Divide": lambda text: Op(T.Divide, None, None),
+    "Modulo": lambda text: Op(T.Modulo, None, None),
+    # punctuation never ends up in the ast, so every occurrence shares one node
+    "Function": Node(T.Arrow, "->"),
+    "Comma": Node(T.Comma, ","),
+    "LParen": Node(T.LParen, "("),
+    "RParen": Node(T.RParen, ")"),
+    "LBrace": Node(T.LBrace, "{"),
+    "RBrace": Node(T.RBrace, "}"),
+    "Semicolon": Node(T.Semicolon, ";"),
+    "Assign": Node(T.Assign, "="),
+}
+
+
+@contextmanager
+def gc_paused():
+    """pauses the cyclic collector while building objects that all survive, which it would only rescan over and over"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# replacing the text from offset start up to offset end of a source with text, see Parser.reparse
+Edit = namedtuple("Edit", ["start", "end", "text"])
+
+
+class Parser:
+    def __init__(self, code):
+        self.code = code
+
+    def tokenizer(self, code, start=0, end=None):
+        """Turn a code string into an array of tokens.  Each token
+           is a node for '{', '}', '(', ')', '+', '-', '*', '/', a variable
+           name, a number or a keyword, ending with an EOF node.
+           Only code[start:end] is read, without copying it.
+           self.positions gets the offset in code of every token, for error messages"""
+        if end is None:
+            end = len(code)
+        tokens = []
+        append = tokens.append
+        positions = self.positions = array("q")
+        add_position = positions.append
+        nodes = token_nodes
+        i = 0
+        pos = start
+        # same matching as tokenize, but straight into nodes since the parser needs the whole list anyway
+        for match in token_pattern.finditer(code, start, end):
+            start = match.start()
+            if start != pos:
+                break
+            pos = match.end()
+            group = match.lastgroup
+            make = nodes.get(group)
+            if make is None:
+                continue
+            if type(make) is Node:
+                append(make)
+            else:
+                text = match.group()
+                node = make(text)
+                node.token = text
+                node.ti = i
+                append(node)
+            add_position(start)
+            i += 1
+        if pos != end:
+            line, col = position(code, pos)
+            raise SyntaxError(
+                "Unexpected character {!r} at line {} column {}".format(code[pos], line, col),
+                ("<sparkle>", line, col, self.line(line)),
+            )
+        tokens.append(Node(T.EOF))
+        add_position(end)
+        return tokens
+
+    def line(self, number):
+        """the text of a 1-based line of the code"""
+        return self.code.split("\n")[number - 1]
+
+    def error(self, tokens, t, message):
+        """raises a SyntaxError pointing at the token at t.i"""
+        token = tokens[t.i]
+        line, col = position(self.code, self.positions[t.i])
+        found = "the end of the input" if token.op == T.EOF else repr(token.token)
+        raise SyntaxError(
+            "{} at line {} column {}, found {}".format(message, line, col, found),
+            ("<sparkle>", line, col, self.line(line)),
+        )
+
+    def expect(self, tokens, t, op, what):
+        """steps over the token at t.i, which has to be an op"""
+        if tokens[t.i].op != op:
+            self.error(tokens, t, "Expected " + what)
+        t.i += 1
+
+    def parse(self):
+        """Returns an un-optimized AST"""
+        root = Root()
+        with gc_paused():
+            root.statements = self.parse_region(0, len(self.code), root.spans)
+        return root
+
+    def parse_region(self, start, end, spans):
+        """parses the top level statements in code[start:end], appending their (start, end) offsets to spans"""
+        tokens = self.tokenizer(self.code, start, end)
+        return self.parse_statements(tokens, Ref(), T.EOF, spans)
+
+    def reparse(self, root, edit):
+        """Incrementally parses self.code, the source of root after the Edit edit was made to it.
+        Only the top level statements the edit touches are tokenized and parsed again, from the one the edit starts in
+        up to the first statement after the edit that still starts where a statement of the new code starts,
+        since parsing from there on gives the statements root already has.
+        Returns the new Root, which shares its other statements with root, and the list of the statements that are new"""
+        start, end, text = edit
+        delta = len(text) - (end - start)
+        statements = root.statements
+        spans = root.spans
+        n = len(statements)
+        # the statement the edit starts in, or the one before it, since an edit in the gap after a statement may extend it
+        first = max(bisect_left(spans, (start,)) - 1, 0)
+        offset = spans[first][0] if first else 0
+        # the first statement that starts after the edit, and the last one parsed again on this try
+        after = bisect_right(spans, (end, float("inf")))
+        stop = after
+        more = 1
+        while True:
+            region_end = spans[stop][1] + delta if stop < n else len(self.code)
+            new_spans = []
+            try:
+                with gc_paused():
+                    new = self.parse_region(offset, region_end, new_spans)
+            except SyntaxError:
+                if stop >= n:
+                    raise
+                # may only be the cut at region_end, try again with more statements
+            else:
+                starts = {span[0]: i for i, span in enumerate(new_spans)}
+                for old in range(after, min(stop + 1, n)):
+                    i = starts.get(spans[old][0] + delta)
+                    if i is not None:
+                        break
+                else:
+                    old = n
+                    i = len(new)
+                if old < n or stop >= n:
+                    break
+            stop = min(stop + more, n)
+            more *= 2
+        updated = Root(statements[:first] + new[:i] + statements[old:])
+        with gc_paused():
+            updated.spans = spans[:first] + new_spans[:i] + [(s + delta, e + delta) for s, e in spans[old:]]
+        return updated, new[:i]
+
+    def parse_statements(self, tokens, t, end, spans=None):
+        """Parses statements up to the end token, EOF or '}', and leaves t.i on it.
+        Blocks nested in the statements are parsed here with a stack of the enclosing statement lists
+        instead of by recursing, so a block can be nested any number of levels deep.
+        With spans, the (start, end) offsets of every statement are appended to it"""
+        statements = []
+        enclosing = []
+        positions = self.positions
+        begin = 0
+        while True:
+            op = tokens[t.i].op
+            if not enclosing:
+                begin = positions[t.i]
+            if op == T.LBrace:
+                t.i += 1
+                enclosing.append(statements)
+                statements = []
+                continue
+            elif op == T.RBrace and enclosing:
+                t.i += 1
+                block = BlockStatement(statements)
+                statements = enclosing.pop()
+                statements.append(block)
+            elif op == T.RBrace or op == T.EOF:
+                if op != end or enclosing:
+                    self.error(tokens, t, "Expected '}'" if op == T.EOF else "Expected a statement")
+                return statements
+            else:
+                statements.append(self.parse_statement(tokens, t))
+            if tokens[t.i].op == T.Semicolon:
+                t.i += 1
+            if spans is not None and not enclosing:
+                last = t.i - 1
+                spans.append((begin, positions[last] + len(tokens[last].token)))
+
+    def parse_statement(self, tokens, t):
+        if tokens[t.i].op == T.Return:
+            node = tokens[t.i]
+            t.i += 1
+            node.expression = self.parse_expression(tokens, t)
+            return node
+        elif tokens[t.i].op == T.Let:
+            node = tokens[t.i]
+            t.i += 1  # to identifier
+            if tokens[t.i].op != T.Ident:
+                self.error(tokens, t, "Expected a name after let")
+            node.identifier = tokens[t.i]
+            t.i += 1
+            self.expect(tokens, t, T.Assign, "'=' after let {}".format(node.identifier.identifier))
+            node.expression = self.parse_expression(tokens, t)
+            return node
+        elif tokens[t.i].op == T.LBrace:
+            return self.parse_block(tokens, t)
+        else:
+            return self.parse_expression(tokens, t)
+
+    def parse_block(self, tokens, t):
+        """parses a block starting at the '{' at t.i, on the same token list"""
+        t.i += 1
+        bnode = BlockStatement(self.parse_statements(tokens, t, T.RBrace))
+        t.i += 1
+        return bnode
+
+    def parse_expression(self, tokens, t):
+        if tokens[t.i].op == T.Function:
+            node = tokens[t.i]
+            t.i += 1  # advance past fn to lparen
+            self.expect(tokens, t, T.LParen, "'(' after fn")
+            node.arguments = []
+            if tokens[t.i].op != T.RParen:
+                while True:
+                    if tokens[t.i].op != T.Ident:
+                        self.error(tokens, t, "Expected a parameter name")
+                    node.arguments.append(tokens[t.i])
+                    t.i += 1
+                    if tokens[t.i].op != T.Comma:
+                        break
+                    t.i += 1
+            self.expect(tokens, t, T.RParen, "')' after the parameters")
+            self.expect(tokens, t, T.Arrow, "'->' after the parameters")
+            node.statements = self.parse_statement(tokens, t)
+            return node
+        lhs = self.parse_binary(tokens, t, 0)
+        if tokens[t.i].op == T.Assign:
+            t.i += 1  # advance to "Expression" start which also subparses additional assignments
+            return Assignment(lhs, self.parse_expression(tokens, t))
+        return lhs
+
+    def parse_binary(self, tokens, t, min_power, left=None):
+        """Precedence climbing over binary_operators, parses the operators that bind at least as tight as min_power,
+        starting from the operand left if it has already been parsed.
+        A run of operators of the same power makes one MultiExpressionNode, where for each ops[i],
+        the subexpression is nodes[i] ~ ops[i] ~ nodes[i+1]"""
+        powers = binding_powers
+        if left is None:
+            left = self.parse_operand(tokens, t)
+        power = powers.get(tokens[t.i].token)
+        while power is not None and power >= min_power:
+            level = power
+            nodes = [left]
+            ops = []
+            while power == level:
+                ops.append(tokens[t.i])
+                t.i += 1
+                right = self.parse_operand(tokens, t)
+                power = powers.get(tokens[t.i].token)
+                if power is not None and power > level:
+                    # only an operand that starts a tighter chain takes a level of recursion
+                    right = self.parse_binary(tokens, t, level + 1, right)
+                    power = powers.get(tokens[t.i].token)
+                nodes.append(right)
+            left = MultiExpressionNode(nodes, ops)
+        return left
+
+    def parse_operand(self, tokens, t):
+        """a number, a variable or a parenthesized expression, called if arguments follow"""
+        node = tokens[t.i]
+        op = node.op
+        if op == T.Ident or op == T.Integer:
+            t.i += 1
+        elif op == T.LParen:
+            t.i += 1
+            node = self.parse_expression(tokens, t)
+            self.expect(tokens, t, T.RParen, "')'")
+        else:
+            self.error(tokens, t, "Expected an expression")
+        if tokens[t.i].op == T.LParen:
+            args = []
+            t.i += 1
+            args.append(self.parse_expression(tokens, t))
+            while tokens[t.i].op == T.Comma:
+                t.i += 1
+                args.append(self.parse_expression(tokens, t))
+            self.expect(tokens, t, T.RParen, "')' after the arguments")
+            return FCall(node, args)
+        return node
+
+    def __repr__(self):
+        return "<Parser object>"
+
+    def represent_codepos(self, tokens, t):
+        s1 = " ".join(t.token for t in tokens)
+        p = 0
+        for tok in tokens[: t.i]:
+            p += 1 + len(tok.token)
+        s2 = " " * p + "^"
+        print(s1 + "\n" + s2)
+
+
+class FunctionProto:
+    """compiled form of a Function node, its body lives at code[entry:] in the enclosing Program"""
+
+    __slots__ = ["entry", "nparams", "nslots", "node"]
+
+    def __init__(self, node, entry=-1, nparams=0, nslots=0):
+        # node is None for a function loaded from a ProgramImage, which has nparams and nslots instead
+        self.node = node
+        self.entry = entry
+        self.nparams = len(node.arguments) if node is not None else nparams
+        self.nslots = node.nslots if node is not None else nslots
+
+    def __repr__(self):
+        return "<FunctionProto entry={}>".format(self.entry)
+
+
+class Program:
+    """flat bytecode for a whole script, with the constants its instructions index into"""
+
+    __slots__ = ["code", "constants", "nglobals"]
+
+    def __init__(self, code, constants, nglobals):
+        self.code = code
+        self.constants = constants
+        self.nglobals = nglobals
+
+    def disassemble(self):
+        lines = []
+        for pc in range(0, len(self.code), 2):
+            op, arg = self.code[pc], self.code[pc + 1]
+            if op in (LOAD_CONST, MAKE_CLOSURE):
+                argrepr = repr(self.constants[arg])
+            elif op in (LOAD_DEREF, STORE_DEREF):
+                argrepr = "{} up, slot {}".format(arg >> DEREF_SHIFT, arg & DEREF_MASK)
+            else:
+                argrepr = str(arg)
+            lines.append("{:>5} {:<13} {}".format(pc, opnames[op], argrepr))
+        return "\n".join(lines)
+
+
+class BytecodeCompiler:
+    """Compiles a resolved AST into a Program for the VM.
+    Function bodies are appended after the global code, in the order they are encountered"""
+
+    def __init__(self):
+        self.code = array("i")
+        self.constants = []
+        self.constant_indices = {}
+        self.pending = []
+        # whether function bodies are being compiled, a call returned from the global code is an ordinary call
+        # so the global frame stays at the bottom of the stack, as in the other backends
+        self.in_function = False
+
+    def compile(self, root):
+        root.visit(self)
+        self.in_function = True
+        while self.pending:
+            proto = self.pending.pop(0)
+            proto.entry = len(self.code)
+            self.function_body(proto.node.statements)
+        return Program(self.code, self.constants, root.nslots)
+
+    def emit(self, op, arg=0):
+        self.code.append(op)
+        self.code.append(arg)
+
+    def constant(self, value):
+        key = (type(value), value)
+        if key not in self.constant_indices:
+            self.constant_indices[key] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_indices[key]
+
+    def function(self, node):
+        proto = FunctionProto(node)
+        self.pending.append(proto)
+        self.constants.append(proto)
+        return len(self.constants) - 1
+
+    def load(self, identifier):
+        self.variable(identifier, LOAD_LOCAL, LOAD_GLOBAL, LOAD_DEREF)
+
+    def store(self, identifier):
+        self.variable(identifier, STORE_LOCAL, STORE_GLOBAL, STORE_DEREF)
+
+    def variable(self, identifier, local, global_, deref):
+        if identifier.depth == 0:
+            self.emit(local, identifier.slot)
+        elif identifier.depth == GLOBAL:
+            self.emit(global_, identifier.slot)
+        else:
+            if identifier.slot > DEREF_MASK:
+                raise RuntimeError("Too many variables in one function")
+            self.emit(deref, identifier.depth << DEREF_SHIFT | identifier.slot)
+
+    def statement(self, node):
+        if isinstance(node, Assignment):
+            # the value of an assignment statement is unused, so it is stored without a copy
+            node.rhs.visit(self)
+            self.store(node.lhs)
+            return
+        node.visit(self)
+        if node.op not in (T.Return, T.Let, T.Block):
+            # expression statement, its value is unused
+            self.emit(POP_TOP)
+
+    def function_body(self, node):
+        if isinstance(node, (BlockStatement, LetStatement)):
+            self.statement(node)
+            self.emit(LOAD_CONST, self.constant(None))
+            self.emit(RETURN_VALUE)
+        elif isinstance(node, ReturnStatement):
+            node.visit(self)
+        else:
+            self.tail(node)
+
+    def tail(self, node):
+        """returns the value of node, reusing the frame if it is a call"""
+        if isinstance(node, FCall) and self.in_function:
+            node.fn.visit(self)
+            for arg in node.args:
+                arg.visit(self)
+            self.emit(TAIL_CALL, len(node.args))
+        else:
+            node.visit(self)
+            self.emit(RETURN_VALUE)
+
+
+class VM:
+    """Executes a Program with a value stack and an explicit call stack, so Sparkle calls do not recurse in python"""
+
+    def run(self, program, globals_, limits=None):
+        """limits is a Limits checked at calls, tail calls and returns"""
+        try:
+            # never yields without every
+            next(self.execute(program, globals_, limits))
+        except StopIteration as stop:
+            return stop.value
+
+    def execute(self, program, globals_, limits=None, every=None):
+        """Generator running program, it returns the value of the program.
+        With every, it yields None every that many calls, and yields whatever awaitable a host function returns
+        so the driver can await it and send back its result, see Interpreter.run_async"""
+        countdown = every
+        code = program.code
+        constants = program.constants
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        frames = []
+        frame = globals_
+        pc = 0
+        while True:
+            op = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+            if op == LOAD_LOCAL:
+                push(frame[arg])
+            elif op == LOAD_CONST:
+                push(constants[arg])
+            elif op == LOAD_GLOBAL:
+                push(globals_[arg])
+            elif op == MUL:
+                b = pop()
+                stack[-1] = stack[-1] * b
+            elif op == ADD:
+                b = pop()
+                stack[-1] = stack[-1] + b
+            elif op == SUB:
+                b = pop()
+                stack[-1] = stack[-1] - b
+            elif op == DIV:
+                b = pop()
+                stack[-1] = stack[-1] / b
+            elif op == MOD:
+                b = pop()
+                stack[-1] = stack[-1] % b
+            elif op == CALL or op == TAIL_CALL:
+                if every is not None:
+                    countdown -= 1
+                    if not countdown:
+                        countdown = every
+                        yield None
+                base = len(stack) - arg
+                fn = stack[base - 1]
+                if type(fn) is not Closure:
+                    if not callable(fn):
+                        raise TypeError("{!r} is not a function".format(fn))
+                    # a python function bound by the host
+                    value = fn(*stack[base:])
+                    if every is not None and inspect.isawaitable(value):
+                        value = yield value
+                    del stack[base - 1 :]
+                    if op == CALL:
+                        push(value)
+                        continue
+                    if not frames:
+                        return value
+                    push(value)
+                    if limits is not None:
+                        limits.exit(len(frame) - 1)
+                    pc, frame = frames.pop()
+                    continue
+                proto = fn.function
+                if arg != proto.nparams:
+                    raise TypeError("function takes {} arguments but {} were given".format(proto.nparams, arg))
+                new = [fn.env]
+                new += stack[base:]
+                del stack[base - 1 :]
+                new += [None] * (proto.nslots - arg)
+                if op == CALL:
+                    frames.append((pc, frame))
+                    if limits is not None:
+                        limits.enter(proto.nslots)
+                elif limits is not None:
+                    limits.replace(len(frame) - 1, proto.nslots)
+                frame = new
+                pc = proto.entry
+            elif op == RETURN_VALUE:
+                if not frames:
+                    return pop()
+                if limits is not None:
+                    limits.exit(len(frame) - 1)
+                pc, frame = frames.pop()
+            elif op == STORE_LOCAL:
+                frame[arg] = pop()
+            elif op == STORE_GLOBAL:
+                globals_[arg] = pop()
+            elif op == DUP_TOP:
+                push(stack[-1])
+            elif op == POP_TOP:
+                pop()
+            elif op == MAKE_CLOSURE:
+                push(Closure(constants[arg], frame))
+            elif op == LOAD_DEREF:
+                f = frame
+                for _ in range(arg >> DEREF_SHIFT):
+                    f = f[0]
+                push(f[arg & DEREF_MASK])
+            elif op == STORE_DEREF:
+                f = frame
+                for _ in range(arg >> DEREF_SHIFT):
+                    f = f[0]
+                f[arg & DEREF_MASK] = pop()
+            else:
+                raise RuntimeError("Unknown opcode {}".format(op))
+
+
+def settle(value):
+    """runs the tail calls returned by functions compiled by PythonCompiler until there is a value,
+    any other value is returned as it is"""
+    while type(value) is TailCall:
+        value = value.callee(*value.args)
+    return value
+
+
+class PythonCompiler:
+    """Translates a resolved AST into the source of a python function run(g), g being the global frame.
+    Every Sparkle function becomes a nested def and every frame slot a python variable named after the nesting level
+    of its function and the slot, so variables, arithmetic and calls all run as python bytecode.
+    A call in tail position returns a TailCall instead, so tail calls still run in constant stack space"""
+
+    symbols = {T.Plus: "+", T.Minus: "-", T.Times: "*", T.Divide: "/", T.Modulo: "%"}
+
+    # python's compiler recurses once per operator of an expression, longer chains are evaluated a step at a time
+    max_chain = 64
+
+    def __init__(self, limited=False):
+        # whether every function keeps to the Limits bound to _limits when the source is loaded
+        self.limited = limited
+        self.lines = []
+        self.indent = 1
+        # the nesting level of the function being compiled, 0 is run itself
+        self.level = 0
+        # the variables of enclosing functions assigned in each function being compiled
+        self.nonlocals = [set()]
+        self.ndefs = 0
+
+    def compile(self, root):
+        self.lines.append("def run(g):")
+        root.visit(self)
+        return "\n".join(self.lines) + "\n"
+
+    def emit(self, line):
+        self.lines.append("    " * self.indent + line)
+
+    def variable(self, identifier, store=False):
+        level = 0 if identifier.depth == GLOBAL else self.level - identifier.depth
+        name = "v{}_{}".format(level, identifier.slot)
+        if store and level != self.level:
+            self.nonlocals[-1].add(name)
+        return name
+
+    def statement(self, node):
+        if isinstance(node, Assignment):
+            # the value of an assignment statement is unused, so it is a plain python assignment
+            value = node.rhs.visit(self)
+            self.emit("{} = {}".format(self.variable(node.lhs, store=True), value))
+        elif node.op in (T.Return, T.Let, T.Block):
+            node.visit(self)
+        else:
+            self.emit(node.visit(self))
+
+    def chain(self, nodes, ops):
+        """a chain evaluated left to right like MultiExpressionNode.run does, what came before an operator
+        is only put in parentheses if the operator binds tighter than the last one"""
+        operands = [node.visit(self) for node in nodes]
+        if len(operands) > self.max_chain:
+            steps = ["_c := " + operands[0]]
+            steps += ["_c := _c {} {}".format(self.symbols[op.op], operand) for op, operand in zip(ops, operands[1:])]
+            return "({})[-1]".format(", ".join(steps))
+        s = operands[0]
+        power = None
+        for op, operand in zip(ops, operands[1:]):
+            if power is not None and precedence_groups[op.op] > power:
+                s = "(" + s + ")"
+            power = precedence_groups[op.op]
+            s += " {} {}".format(self.symbols[op.op], operand)
+        return "(" + s + ")"
+
+    def call(self, node):
+        return "{}({})".format(node.fn.visit(self), ", ".join(arg.visit(self) for arg in node.args))
+
+    def tail(self, node):
+        """the value of node returned from a function, a call is left to the caller"""
+        if isinstance(node, FCall) and self.level:
+            return "TailCall({}, [{}])".format(node.fn.visit(self), ", ".join(arg.visit(self) for arg in node.args))
+        return node.visit(self)
+
+    def function(self, node):
+        """emits a def for node before the statement being compiled, returns its name"""
+        self.ndefs += 1
+        name = "{}_{}".format(re.sub(r"\W", "_", node.name or "fn"), self.ndefs)
+        outer = self.lines
+        self.lines = []
+        self.level += 1
+        # a limited body goes inside try: finally:
+        self.indent += 2 if self.limited else 1
+        self.nonlocals.append(set())
+        nparams = len(node.arguments)
+        params = ["v{}_{}".format(self.level, slot) for slot in range(1, nparams + 1)]
+        # every slot starts out as None, like the frames of the other backends
+        locals_ = ["v{}_{}".format(self.level, slot) for slot in range(nparams + 1, node.nslots + 1)]
+        if locals_:
+            self.emit(" = ".join(locals_) + " = None")
+        body = node.statements
+        if isinstance(body, (BlockStatement, LetStatement)):
+            self.statement(body)
+            self.emit("return None")
+        elif isinstance(body, ReturnStatement):
+            body.visit(self)
+        else:
+            self.emit("return " + self.tail(body))
+        lines = self.lines
+        self.lines = outer
+        self.level -= 1
+        self.indent -= 2 if self.limited else 1
+        self.emit("def {}({}):".format(name, ", ".join(params)))
+        self.indent += 1
+        nonlocals = self.nonlocals.pop()
+        if nonlocals:
+            self.emit("nonlocal " + ", ".join(sorted(nonlocals)))
+        if self.limited:
+            self.emit("_limits.enter({})".format(node.nslots))
+            self.emit("try:")
+            self.lines += lines
+            self.emit("finally:")
+            self.emit("    _limits.exit({})".format(node.nslots))
+        else:
+            self.lines += lines
+        self.indent -= 1
+        return name
+
+
+class ClosureCompiler:
+    """Turns a resolved AST into nested python closures, each taking the current frame and nothing else.
+    Operands, slots and operator functions are bound as cell variables when compiling, and the common operand shapes,
+    constants and slots of the current frame, get closures of their own, so running is a chain of direct calls.
+    Function values are python callables, and calls in tail position return a TailCall like PythonCompiler's"""
+
+    def __init__(self, limits=None):
+        # the nesting level of the function being compiled, the global frame is this many links up
+        self.level = 0
+        # the Limits the compiled functions keep to, if any
+        self.limits = limits
+
+    def compile(self, root):
+        return root.visit(self)
+
+    def closure(self, node):
+        """node compiled, or node itself if it already is a closure"""
+        return node.visit(self) if isinstance(node, Node) else node
+
+    def links(self, identifier):
+        """how many frames up from the current one the identifier lives"""
+        return self.level if identifier.depth == GLOBAL else identifier.depth
+
+    def local(self, node):
+        """the slot of node if it is a variable of the current frame, else None"""
+        if isinstance(node, Identifier) and self.links(node) == 0:
+            return node.slot
+        return None
+
+    def load(self, identifier):
+        slot = identifier.slot
+        links = self.links(identifier)
+        if links == 0:
+            return lambda frame: frame[slot]
+        elif links == 1:
+            return lambda frame: frame[0][slot]
+        elif links == 2:
+            return lambda frame: frame[0][0][slot]
+
+        def load(frame):
+            for _ in range(links):
+                frame = frame[0]
+            return frame[slot]
+
+        return load
+
+    def store(self, identifier, value):
+        """stores the result of the value closure, returns it like an assignment"""
+        slot = identifier.slot
+        links = self.links(identifier)
+        if links == 0:
+
+            def store(frame):
+                frame[slot] = result = value(frame)
+                return result
+
+        else:
+
+            def store(frame):
+                result = value(frame)
+                for _ in range(links):
+                    frame = frame[0]
+                frame[slot] = result
+                return result
+
+        return store
+
+    def chain(self, nodes, ops):
+        """one closure for a whole chain, going through the operands in a loop like MultiExpressionNode.run,
+        so a long chain does not nest a closure per operator"""
+        if len(nodes) == 2:
+            return self.binary(ops[0].opfunc, nodes[0], nodes[1])
+        first = self.closure(nodes[0])
+        rest = tuple((op.opfunc, self.closure(node)) for node, op in zip(nodes[1:], ops))
+
+        def chain(frame):
+            res = first(frame)
+            for f, operand in rest:
+                res = f(res, operand(frame))
+            return res
+
+        return chain
+
+    def binary(self, f, a, b):
+        """a and b are nodes or compiled closures"""
+        a_slot = self.local(a)
+        b_slot = self.local(b)
+        if isinstance(b, Constant):
+            n = b.n
+            if a_slot is not None:
+                return lambda frame: f(frame[a_slot], n)
+            a = self.closure(a)
+            return lambda frame: f(a(frame), n)
+        if isinstance(a, Constant):
+            n = a.n
+            if b_slot is not None:
+                return lambda frame: f(n, frame[b_slot])
+            b = self.closure(b)
+            return lambda frame: f(n, b(frame))
+        if a_slot is not None and b_slot is not None:
+            return lambda frame: f(frame[a_slot], frame[b_slot])
+        a = self.closure(a)
+        b = self.closure(b)
+        return lambda frame: f(a(frame), b(frame))
+
+    def call(self, node):
+        fn = node.fn.visit(self)
+        args = [arg.visit(self) for arg in node.args]
+        if len(args) == 1:
+            (a,) = args
+            call = lambda frame: fn(frame)(a(frame))
+        elif len(args) == 2:
+            a, b = args
+            call = lambda frame: fn(frame)(a(frame), b(frame))
+        else:
+            call = lambda frame: fn(frame)(*[arg(frame) for arg in args])
+
+        def settled(frame):
+            value = call(frame)
+            return value if type(value) is not TailCall else settle(value)
+
+        return settled
+
+    def tail(self, node):
+        """the value of node returned from a function, a call is left to the caller"""
+        if not isinstance(node, FCall) or not self.level:
+            return node.visit(self)
+        fn = node.fn.visit(self)
+        args = [arg.visit(self) for arg in node.args]
+        return lambda frame: TailCall(fn(frame), [arg(frame) for arg in args])
+
+    def block(self, statements, fallthrough):
+        """runs statements until one returns, the value of falling off the end is fallthrough"""
+        if any(statement.op is T.Block for statement in statements):
+            steps = tuple((statement.op, statement.visit(self)) for statement in statements)
+
+            def block(frame):
+                for op, step in steps:
+                    if op is T.Return:
+                        return step(frame)
+                    elif op is T.Block:
+                        value = step(frame)
+                        if value is not NORETURN:
+                            return value
+                    else:
+                        step(frame)
+                return fallthrough
+
+            return block
+        effects = []
+        final = None
+        for statement in statements:
+            if statement.op is T.Return:
+                # anything after a return never runs
+                final = statement.visit(self)
+                break
+            effects.append(statement.visit(self))
+        effects = tuple(effects)
+        if final is None:
+
+            def block(frame):
+                for effect in effects:
+                    effect(frame)
+                return fallthrough
+
+        elif not effects:
+            return final
+        else:
+
+            def block(frame):
+                for effect in effects:
+                    effect(frame)
+                return final(frame)
+
+        return block
+
+    def function(self, node):
+        self.level += 1
+        statements = node.statements
+        if isinstance(statements, BlockStatement):
+            body = self.block(statements.statements, None)
+        elif isinstance(statements, LetStatement):
+            body = self.block([statements], None)
+        else:
+            body = statements.visit(self) if isinstance(statements, ReturnStatement) else self.tail(statements)
+        self.level -= 1
+        nparams = len(node.arguments)
+        nslots = node.nslots
+        padding = (None,) * (nslots - nparams)
+        limits = self.limits
+        if limits is not None:
+            run = body
+
+            def body(frame):
+                # a tail call returns its TailCall through here, so tail calls leave the depth as it was
+                limits.enter(nslots)
+                value = run(frame)
+                limits.exit(nslots)
+                return value
+
+        def make(env):
+            def function(*args):
+                if len(args) != nparams:
+                    raise TypeError("function takes {} arguments but {} were given".format(nparams, len(args)))
+                frame = [env]
+                frame += args
+                frame += padding
+                return body(frame)
+
+            function.__name__ = node.name or "fn"
+            return function
+
+        return make
+
+
+def load_python(source, limits=None):
+    """compiles the source made by PythonCompiler, returns its run function"""
+    namespace = {"TailCall": TailCall, "settle": settle, "_limits": limits}
+    exec(compile(source, "<sparkle>", "exec"), namespace)
+    return namespace["run"]
+
+
+# node kinds of a FlatTree, what a, b and c hold for each and the children they index, if any
+# F_ROOT      a: first child, b: number of statements
+# F_RETURN    a: the expression
+# F_LET       a: the F_NAME node declared, b: the expression
+# F_BLOCK     a: first child, b: number of statements
+# F_ASSIGN    a: the F_NAME node assigned, b: the expression
+# F_FUNCTION  a: the body statement, b: number of parameters, c: nslots
+# F_EXPR      a: first child, b: number of operands, c: first of its operators
+# F_CALL      a: first child, the callee and then the arguments, b: number of children
+# F_INT       a: index into ints
+# F_FLOAT     a: index into floats
+# F_NAME      a: depth, b: slot, c: index into names
+F_ROOT = 0
+F_RETURN = 1
+F_LET = 2
+F_BLOCK = 3
+F_ASSIGN = 4
+F_FUNCTION = 5
+F_EXPR = 6
+F_CALL = 7
+F_INT = 8
+F_FLOAT = 9
+F_NAME = 10
+
+# the operator functions of FlatTree.operators, which are vm opcodes
+flat_opfuncs = [None] * (max(binary_opcodes.values()) + 1)
+for _op, _opcode in binary_opcodes.items():
+    flat_opfuncs[_opcode] = optranslation[_op]
+
+# magic, byte order, version, the root, the size of the global frame, then the length of every column and of the names
+flat_header = struct.Struct("=4s2sHii11I")
+
+# the header of a file of columns is padded to this, so the 8 byte columns that come first stay aligned
+columns_header_size = 64
+
+
+def pack_columns(header, columns, names):
+    """header, then every array of columns as raw bytes, then the encoded names"""
+    parts = [header, bytes(columns_header_size - len(header))]
+    parts += [memoryview(column).cast("B") for column in columns]
+    parts.append(names)
+    return b"".join(parts)
+
+
+def view_columns(view, typecodes, lengths):
+    """memoryviews of the columns that pack_columns wrote into view, and the names after them.
+    lengths has the length of every column and then that of the names"""
+    offset = columns_header_size
+    columns = []
+    for typecode, length in zip(typecodes, lengths):
+        size = length * array(typecode).itemsize
+        columns.append(view[offset : offset + size].cast(typecode))
+        offset += size
+    names = bytes(view[offset : offset + lengths[len(typecodes)]]).decode("utf-8")
+    return columns, names.split("\0") if names else []
+
+
+def check_header(magic, order, version, expected, current, what):
+    if magic != expected:
+        raise ValueError("not a {}".format(what))
+    if order != sys.byteorder[:2].encode("ascii") or version != current:
+        raise ValueError("a {} of byte order {!r}, version {} cannot be read here".format(what, order, version))
+
+
+class FlatTree:
+    """A resolved AST as parallel arrays, one entry per node in kinds, a, b and c, see F_ROOT.
+    Lists of children are runs of node indices in children, operators are vm opcodes, constants live in ints
+    and floats and every name in names. Next to the object tree this takes a few bytes a node instead of
+    a python object each, and to_bytes writes the columns as they are, so from_buffer can run a tree
+    straight from a bytes object or an mmap, viewing the columns in place instead of copying them.
+    run executes the arrays as they are, like the tree backend, with Closures whose function is a node index"""
+
+    # (attribute, typecode), in the order they are written, widest first so every column stays aligned
+    columns = (
+        ("ints", "q"),
+        ("floats", "d"),
+        ("a", "i"),
+        ("b", "i"),
+        ("c", "i"),
+        ("children", "i"),
+        ("symbols", "i"),
+        ("free", "i"),
+        ("kinds", "B"),
+        ("operators", "B"),
+    )
+    version = 1
+
+    def __init__(self):
+        for name, typecode in self.columns:
+            setattr(self, name, array(typecode))
+        self.names = []
+        self.root = 0
+        self.nslots = 0
+
+    def __reduce__(self):
+        return FlatTree.from_buffer, (self.to_bytes(),)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @classmethod
+    def from_ast(cls, root):
+        """the FlatTree of a resolved Root"""
+        tree = cls()
+        index = {}
+        for name in list(root.symbols) + list(root.free):
+            tree.name(name, index)
+        tree.root = tree.add(root, index)
+        tree.nslots = root.nslots
+        for name, slot in root.symbols.items():
+            tree.symbols.append(index[name])
+            tree.symbols.append(slot)
+        for name in root.free:
+            tree.free.append(index[name])
+        return tree
+
+    def name(self, name, index):
+        if name not in index:
+            index[name] = len(self.names)
+            self.names.append(name)
+        return index[name]
+
+    def node(self, kind, a=0, b=0, c=0):
+        self.kinds.append(kind)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+        return len(self.kinds) - 1
+
+    def group(self, nodes, index):
+        """adds nodes, returns where their run of children starts"""
+        indices = [self.add(node, index) for node in nodes]
+        first = len(self.children)
+        self.children.extend(indices)
+        return first
+
+    def add(self, node, index):
+        """adds node and everything under it, returns its index"""
+        if isinstance(node, Root):
+            return self.node(F_ROOT, self.group(node.statements, index), len(node.statements))
+        elif isinstance(node, ReturnStatement):
+            return self.node(F_RETURN, self.add(node.expression, index))
+        elif isinstance(node, LetStatement):
+            return self.node(F_LET, self.add(node.identifier, index), self.add(node.expression, index))
+        elif isinstance(node, BlockStatement):
+            return self.node(F_BLOCK, self.group(node.statements, index), len(node.statements))
+        elif isinstance(node, Assignment):
+            if not isinstance(node.lhs, Identifier):
+                raise RuntimeError("Invalid assignment target " + AstPrinter().tostring(node.lhs))
+            return self.node(F_ASSIGN, self.add(node.lhs, index), self.add(node.rhs, index))
+        elif isinstance(node, Function):
+            return self.node(F_FUNCTION, self.add(node.statements, index), len(node.arguments), node.nslots)
+        elif isinstance(node, (MultiExpressionNode, Op)):
+            nodes, ops = (node.nodes, node.ops) if isinstance(node, MultiExpressionNode) else ([node.a, node.b], [node])
+            first = self.group(nodes, index)
+            operators = len(self.operators)
+            self.operators.extend(binary_opcodes[op.op] for op in ops)
+            return self.node(F_EXPR, first, len(nodes), operators)
+        elif isinstance(node, FCall):
+            return self.node(F_CALL, self.group([node.fn] + node.args, index), len(node.args) + 1)
+        elif isinstance(node, Constant):
+            if type(node.n) is float:
+                self.floats.append(node.n)
+                return self.node(F_FLOAT, len(self.floats) - 1)
+            try:
+                self.ints.append(node.n)
+            except OverflowError:
+                raise ValueError("a FlatTree only holds 64 bit integers, not {}".format(node.n))
+            return self.node(F_INT, len(self.ints) - 1)
+        elif isinstance(node, Identifier):
+            return self.node(F_NAME, node.depth, node.slot, self.name(node.identifier, index))
+        raise TypeError("no flat encoding for {!r}".format(node))
+
+    def nbytes(self):
+        """the size of the columns and names, what to_bytes writes"""
+        size = columns_header_size + len("\0".join(self.names).encode("utf-8"))
+        for name, typecode in self.columns:
+            size += len(getattr(self, name)) * array(typecode).itemsize
+        return size
+
+    def to_bytes(self):
+        columns = [getattr(self, name) for name, _ in self.columns]
+        names = "\0".join(self.names).encode("utf-8")
+        order = sys.byteorder[:2].encode("ascii")
+        lengths = [len(column) for column in columns] + [len(names)]
+        return pack_columns(flat_header.pack(b"SPKT", order, self.version, self.root, self.nslots, *lengths), columns, names)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """a FlatTree over the columns in buffer, as written by to_bytes, without copying them.
+        The buffer has to stay alive and unchanged for as long as the tree is used"""
+        view = memoryview(buffer).cast("B")
+        magic, order, version, root, nslots, *lengths = flat_header.unpack_from(view)
+        check_header(magic, order, version, b"SPKT", cls.version, "flat Sparkle tree")
+        tree = cls.__new__(cls)
+        columns, tree.names = view_columns(view, [typecode for _, typecode in cls.columns], lengths)
+        for (name, _), column in zip(cls.columns, columns):
+            setattr(tree, name, column)
+        tree.root = root
+        tree.nslots = nslots
+        return tree
+
+    def run(self, globals_, limits=None):
+        """runs the tree in the global frame globals_, laid out as for the other backends"""
+        kinds, a, b, c, children, operators = self.kinds, self.a, self.b, self.c, self.children, self.operators
+        ints, floats, names = self.ints, self.floats, self.names
+        opfuncs = flat_opfuncs
+
+        def evaluate(i, frame):
+            kind = kinds[i]
+            if kind == F_NAME:
+                depth = a[i]
+                if depth == GLOBAL:
+                    return globals_[b[i]]
+                while depth:
+                    frame = frame[0]
+                    depth -= 1
+                return frame[b[i]]
+            elif kind == F_INT:
+                return ints[a[i]]
+            elif kind == F_EXPR:
+                first, o = a[i], c[i]
+                res = evaluate(children[first], frame)
+                for k in range(1, b[i]):
+                    res = opfuncs[operators[o + k - 1]](res, evaluate(children[first + k], frame))
+                return res
+            elif kind == F_CALL:
+                callee, args = arguments(i, frame)
+                if type(callee) is Closure:
+                    return invoke(callee, args)
+                return callee(*args)
+            elif kind == F_FUNCTION:
+                return Closure(i, frame)
+            elif kind == F_ASSIGN:
+                value = evaluate(b[i], frame)
+                store(a[i], frame, value)
+                return value
+            elif kind == F_FLOAT:
+                return floats[a[i]]
+            raise TypeError("node {} of kind {} is not an expression".format(i, kind))
+
+        def store(i, frame, value):
+            depth = a[i]
+            if depth == GLOBAL:
+                frame = globals_
+            while depth > 0:
+                frame = frame[0]
+                depth -= 1
+            frame[b[i]] = value
+
+        def arguments(i, frame):
+            """the callee and arguments of call i"""
+            first = a[i]
+            callee = evaluate(children[first], frame)
+            if type(callee) is not Closure and not callable(callee):
+                fn = children[first]
+                raise TypeError("{} is not a function".format(names[c[fn]] if kinds[fn] == F_NAME else "expression"))
+            return callee, [evaluate(children[k], frame) for k in range(first + 1, first + b[i])]
+
+        def execute(i, frame):
+            """runs statement i, returns NORETURN unless it returned, a call in tail position returns a TailCall"""
+            kind = kinds[i]
+            if kind == F_RETURN:
+                value = a[i]
+                if kinds[value] == F_CALL:
+                    return TailCall(*arguments(value, frame))
+                return evaluate(value, frame)
+            elif kind == F_LET:
+                frame[b[a[i]]] = evaluate(b[i], frame)
+            elif kind == F_BLOCK or kind == F_ROOT:
+                first = a[i]
+                for k in range(first, first + b[i]):
+                    value = execute(children[k], frame)
+                    if value is not NORETURN:
+                        return value
+            else:
+                evaluate(i, frame)
+            return NORETURN
+
+        def invoke(closure, args):
+            """calls closure, with a trampoline for the tail calls it makes like Function.enter"""
+            f = closure.function
+            if len(args) != b[f]:
+                raise TypeError("function takes {} arguments but {} were given".format(b[f], len(args)))
+            if limits is not None:
+                limits.enter(c[f])
+            while True:
+                frame = [closure.env]
+                frame += args
+                frame += [None] * (c[f] - len(args))
+                body = a[f]
+                kind = kinds[body]
+                if kind == F_CALL:
+                    rval = TailCall(*arguments(body, frame))
+                elif kind == F_RETURN or kind == F_LET or kind == F_BLOCK:
+                    rval = execute(body, frame)
+                else:
+                    rval = evaluate(body, frame)
+                if type(rval) is not TailCall:
+                    break
+                closure, args = rval.callee, rval.args
+                if type(closure) is not Closure:
+                    rval = closure(*args)
+                    break
+                if limits is not None:
+                    limits.replace(c[f], c[closure.function])
+                f = closure.function
+                if len(args) != b[f]:
+                    raise TypeError("function takes {} arguments but {} were given".format(b[f], len(args)))
+            if limits is not None:
+                limits.exit(c[f])
+            return None if rval is NORETURN else rval
+
+        rval = execute(self.root, globals_)
+        if type(rval) is TailCall:
+            callee, args = rval.callee, rval.args
+            return invoke(callee, args) if type(callee) is Closure else callee(*args)
+        return None if rval is NORETURN else rval
+
+
+# the kinds of the constants of a ProgramImage, each taking the next value of its pool
+C_NONE = 0
+C_INT = 1
+C_FLOAT = 2
+C_FUNCTION = 3
+
+# magic, byte order, version, the size of the global frame, then the length of every column and of the names
+image_header = struct.Struct("=4s2sHi8I")
+
+
+class ProgramImage:
+    """A compiled script as one binary image: the vm bytecode, a constants pool and a symbol table,
+    laid out like a FlatTree by pack_columns. open maps an image file and runs its bytecode where it lies,
+    no parsing and no copy of the code, only the constants and the names of the globals become python objects.
+    The image is tied to the byte order and the opcodes it was written with, see version"""
+
+    # (attribute, typecode), in the order they are written. functions has (entry, nparams, nslots) for every
+    # C_FUNCTION constant, symbols has (name, slot) for every global and free the names the host has to bind
+    columns = (
+        ("ints", "q"),
+        ("floats", "d"),
+        ("code", "i"),
+        ("functions", "i"),
+        ("symbols", "i"),
+        ("free", "i"),
+        ("kinds", "B"),
+    )
+    version = 1
+
+    def __init__(self, program, symbols, free):
+        self.program = program
+        self.symbols = symbols
+        self.free = free
+        self.buffer = None
+
+    @classmethod
+    def compile(cls, code, optimize=True):
+        script = CompiledScript(code, optimize)
+        script.compile("vm")
+        return cls(script.program, script.ast.symbols, script.ast.free)
+
+    def to_bytes(self):
+        columns = {name: array(typecode) for name, typecode in self.columns}
+        for value in self.program.constants:
+            if value is None:
+                columns["kinds"].append(C_NONE)
+            elif type(value) is FunctionProto:
+                columns["kinds"].append(C_FUNCTION)
+                columns["functions"].extend((value.entry, value.nparams, value.nslots))
+            elif type(value) is float:
+                columns["kinds"].append(C_FLOAT)
+                columns["floats"].append(value)
+            else:
+                columns["kinds"].append(C_INT)
+                try:
+                    columns["ints"].append(value)
+                except OverflowError:
+                    raise ValueError("a ProgramImage only holds 64 bit integers, not {}".format(value))
+        columns["code"] = self.program.code
+        names = list(self.symbols)
+        names += [name for name in self.free if name not in self.symbols]
+        index = {name: i for i, name in enumerate(names)}
+        for name, slot in self.symbols.items():
+            columns["symbols"].extend((index[name], slot))
+        columns["free"].extend(index[name] for name in self.free)
+        columns = [columns[name] for name, _ in self.columns]
+        encoded = "\0".join(names).encode("utf-8")
+        order = sys.byteorder[:2].encode("ascii")
+        lengths = [len(column) for column in columns] + [len(encoded)]
+        header = image_header.pack(b"SPKI", order, self.version, self.program.nglobals, *lengths)
+        return pack_columns(header, columns, encoded)
+
+    def save(self, path):
+        # written next to the target and renamed, so workers never map half an image
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp, path)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """the image in buffer, running its code in place. The buffer has to stay alive and unchanged"""
+        view = memoryview(buffer).cast("B")
+        magic, order, version, nglobals, *lengths = image_header.unpack_from(view)
+        check_header(magic, order, version, b"SPKI", cls.version, "Sparkle program image")
+        columns, names = view_columns(view, [typecode for _, typecode in cls.columns], lengths)
+        ints, floats, code, functions, symbols, free, kinds = columns
+        constants = []
+        pools = {C_INT: iter(ints), C_FLOAT: iter(floats)}
+        entries = iter(functions)
+        for kind in kinds:
+            if kind == C_NONE:
+                constants.append(None)
+            elif kind == C_FUNCTION:
+                constants.append(FunctionProto(None, next(entries), next(entries), next(entries)))
+            else:
+                constants.append(next(pools[kind]))
+        image = cls(
+            Program(code, constants, nglobals),
+            {names[symbols[i]]: symbols[i + 1] for i in range(0, len(symbols), 2)},
+            [names[i] for i in free],
+        )
+        image.buffer = buffer
+        return image
+
+    @classmethod
+    def open(cls, path):
+        """maps the image file at path, pages of code are read as the vm reaches them"""
+        with open(path, "rb") as f:
+            return cls.from_buffer(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self):
+        """releases the mapping of an opened image, which cannot be run after"""
+        if isinstance(self.buffer, mmap.mmap):
+            self.program.code.release()
+            self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def run(self, bindings=None, limits=None):
+        """runs the image like Interpreter.run on the vm backend"""
+        frame = global_frame(self.program.nglobals, self.symbols, self.free, bindings)
+        if limits is not None:
+            limits.reset(self.program.nglobals)
+        return VM().run(self.program, frame, limits)
+
+
+class Hook:
+    """Base class for hooks attached with Interpreter.attach, called around the evaluation of every node.
+    Attached hooks run on an instrumented copy of the tree, so the plain tree pays nothing for them.
+    Calls in tail position are made as plain calls there, every one of them is seen with its value"""
+
+    def enter(self, interpreter, node):
+        pass
+
+    def exit(self, interpreter, node, value):
+        pass
+
+
+class TraceHook(Hook):
+    """prints every node as it is entered and the value it evaluated to, indented by nesting"""
+
+    def __init__(self, file=None):
+        self.file = file
+        self.depth = 0
+
+    def enter(self, interpreter, node):
+        print("  " * self.depth + AstPrinter().tostring(node), file=self.file)
+        self.depth += 1
+
+    def exit(self, interpreter, node, value):
+        self.depth -= 1
+        print("  " * self.depth + "-> " + repr(value), file=self.file)
+
+
+class TracedNode:
+    """stands in for a node in an instrumented tree, running its instrumented copy and reporting the original to hook.
+    Anything else is looked up on the copy, so parents can still read its slots"""
+
+    __slots__ = ["node", "original", "hook", "op"]
+
+    def __init__(self, node, original, hook):
+        self.node = node
+        self.original = original
+        self.hook = hook
+        self.op = node.op
+
+    def __getattr__(self, name):
+        return getattr(self.node, name)
+
+    def run(self, interpreter):
+        self.hook.enter(interpreter, self.original)
+        value = self.node.run(interpreter)
+        self.hook.exit(interpreter, self.original, value)
+        return value
+
+    def tail_run(self, interpreter):
+        # the call is made here rather than by the trampoline, for hook to see its value,
+        # so tail calls in an instrumented tree stack up like any other call
+        return self.run(interpreter)
+
+
+def copy_tree(root, replace):
+    """a copy of the tree under root, every copied node below root is put in its parent as replace(copy, original)"""
+    memo = {}
+
+    def wrap(node):
+        if id(node) not in memo:
+            memo[id(node)] = replace(clone(node), node)
+        return memo[id(node)]
+
+    def clone(node):
+        new = copy.copy(node)
+        for cls in type(node).__mro__[:-2]:
+            for name in cls.__dict__.get("__slots__", ()):
+                value = getattr(node, name, None)
+                if isinstance(value, Node):
+                    setattr(new, name, wrap(value))
+                elif isinstance(value, list):
+                    setattr(new, name, [wrap(item) if isinstance(item, Node) else item for item in value])
+        return new
+
+    return clone(root)
+
+
+def instrument(root, hook):
+    """a copy of the tree under root in which every node below root reports to hook"""
+    return copy_tree(root, lambda clone, node: TracedNode(clone, node, hook))
+
+
+def memoizing(root):
+    """a copy of the tree under root in which calls are made through MemoizingFCall"""
+
+    def replace(clone, node):
+        if type(clone) is FCall:
+            clone.__class__ = MemoizingFCall
+        return clone
+
+    return copy_tree(root, replace)
+
+
+def source_token(node):
+    """the leftmost node under node that was read from a token, whose ti is where node starts in the source"""
+    while True:
+        if isinstance(node, FCall):
+            node = node.fn
+        elif isinstance(node, MultiExpressionNode):
+            node = node.nodes[0]
+        elif isinstance(node, Op):
+            node = node.a
+        elif isinstance(node, Assignment):
+            node = node.lhs
+        elif isinstance(node, (BlockStatement, Root)) and node.statements:
+            node = node.statements[0]
+        else:
+            return node
+
+
+class Profiler:
+    """Profiles the runs of an Interpreter on the tree backend, see Interpreter.profile.
+    Calls, the frame slots they allocate and the closures made are counted per Function node as they happen.
+    Time is sampled instead: while a run is going, a thread looks at its python stack every interval seconds
+    and charges the time since its last look to the functions being called and to the innermost node running,
+    so the script itself only pays for the counting. A tail call replaces its caller on the sampled stacks
+    as it replaces its frame. Runs add up until reset"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        # python code objects that show where a stack is in the tree
+        # every call of a function, cached or not, runs in Function.enter, where function is the one running
+        self.call_code = Function.enter.__code__
+        self.node_codes = set()
+        classes = [Node]
+        while classes:
+            cls = classes.pop()
+            classes += cls.__subclasses__()
+            for name in ("run", "tail_run"):
+                if name in cls.__dict__:
+                    self.node_codes.add(cls.__dict__[name].__code__)
+        self.code = ""
+        self.positions = array("q")
+        self.reset()
+
+    def reset(self):
+        # Function node -> calls, tail calls included, every one of which allocates a frame of nslots slots
+        # and closures made of it. defaultdicts since these are counted while running, where they are cheaper than Counters
+        self.calls = defaultdict(int)
+        self.closures = defaultdict(int)
+        # tuple of the Function nodes being called, outermost first -> seconds
+        self.stacks = Counter()
+        # innermost node running -> seconds
+        self.nodes = Counter()
+        self.samples = 0
+        self.thread = None
+
+    def start(self, interpreter):
+        """starts sampling the calling thread, which is about to run interpreter"""
+        if interpreter.code is not self.code:
+            self.code = interpreter.code
+            parser = Parser(self.code)
+            parser.tokenizer(self.code)
+            self.positions = parser.positions
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.sample, args=(threading.get_ident(),), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+
+    def sample(self, target):
+        last = timeit.default_timer()
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            now = timeit.default_timer()
+            seconds, last = now - last, now
+            stack = []
+            node = None
+            while frame is not None:
+                code = frame.f_code
+                if code is self.call_code:
+                    local = frame.f_locals
+                    stack.append(local.get("function", local["self"]))
+                elif node is None and code in self.node_codes:
+                    node = frame.f_locals["self"]
+                frame = frame.f_back
+            if node is None:
+                # not in the tree yet or any more
+                continue
+            stack.reverse()
+            self.stacks[tuple(stack)] += seconds
+            self.nodes[node] += seconds
+            self.samples += 1
+
+    def line(self, node):
+        """the 1-based line of the source that node starts on"""
+        ti = source_token(node).ti
+        return position(self.code, self.positions[ti])[0] if ti < len(self.positions) else 0
+
+    def name(self, function):
+        return "{}:{}".format(function.name or "fn", self.line(function))
+
+    def collapsed(self):
+        """the sampled stacks in the collapsed format of flamegraph.pl, one line of
+        semicolon separated frames per stack followed by its time in microseconds"""
+        lines = []
+        for stack, seconds in self.stacks.most_common():
+            frames = ";".join(["<script>"] + [self.name(function) for function in stack])
+            lines.append("{} {}\n".format(frames, round(seconds * 1e6)))
+        return "".join(lines)
+
+    def summary(self):
+        """a dict of the counts and times of every function, slowest first, and the time spent on every line"""
+        total = Counter()
+        own = Counter()
+        for stack, seconds in self.stacks.items():
+            for function in set(stack):
+                total[function] += seconds
+            if stack:
+                own[stack[-1]] += seconds
+        functions = []
+        for function in sorted(set(self.calls) | set(self.closures) | set(total), key=lambda f: -total[f]):
+            functions.append(
+                {
+                    "name": function.name,
+                    "line": self.line(function),
+                    "calls": self.calls[function],
+                    "slots": self.calls[function] * function.nslots,
+                    "closures": self.closures[function],
+                    "cumulative": total[function],
+                    "self": own[function],
+                }
+            )
+        lines = Counter()
+        for node, seconds in self.nodes.items():
+            lines[self.line(node)] += seconds
+        return {
+            "samples": self.samples,
+            "seconds": sum(self.stacks.values()),
+            "functions": functions,
+            "lines": [{"line": line, "seconds": lines[line]} for line in sorted(lines)],
+        }
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+
+# execution backends selectable with Interpreter(code, backend)
+backends = ("tree", "vm", "python", "closure", "flat")
+
+
+class CompiledScript:
+    """everything Interpreter needs to run a source string, the resolved ast and, once compiled,
+    its vm Program, python source or FlatTree"""
+
+    __slots__ = ["ast", "program", "python", "flat", "node_counts"]
+
+    def __init__(self, code, optimize=True):
+        ast = Parser(code).parse()
+        if optimize:
+            optimizer = Optimizer()
+            ast = optimizer.optimize(ast)
+            # (before, after) the Optimizer ran
+            self.node_counts = (optimizer.before, optimizer.after)
+        else:
+            self.node_counts = None
+        self.ast = analyze_purity(Resolver().resolve(ast))
+        self.program = None
+        self.python = None
+        self.flat = None
+
+    def compile(self, backend):
+        """compiles for backend, returns True if anything new was built"""
+        if backend == "vm" and self.program is None:
+            self.program = BytecodeCompiler().compile(self.ast)
+            return True
+        if backend == "python" and self.python is None:
+            self.python = PythonCompiler().compile(self.ast)
+            return True
+        if backend == "flat" and self.flat is None:
+            self.flat = FlatTree.from_ast(self.ast)
+            return True
+        return False
+
+
+class ProgramCache:
+    """LRU cache of CompiledScripts keyed by the sha256 of their source.
+    With a directory, scripts are also persisted there as compressed pickles and loaded back on a miss,
+    only point it at a directory you trust since loading a pickle can run arbitrary code"""
+
+    def __init__(self, maxsize=256, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return "<ProgramCache size={} hits={} misses={} disk_hits={}>".format(
+            len(self.entries), self.hits, self.misses, self.disk_hits
+        )
+
+    # goes up with every change to the slots of the nodes, so older pickles are not loaded
+    version = 5
+
+    def key(self, code, optimize=True):
+        tag = "\0{}{}".format(self.version, "O" if optimize else "").encode("ascii")
+        return hashlib.sha256(code.encode("utf-8") + tag).hexdigest()
+
+    def get(self, code, backend="tree", optimize=True):
+        key = self.key(code, optimize)
+        script = self.entries.get(key)
+        changed = False
+        if script is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        else:
+            script = self.load(key)
+            if script is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                script = CompiledScript(code, optimize)
+                changed = True
+            self.entries[key] = script
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        if script.compile(backend) or changed:
+            self.save(key, script)
+        return script
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".sparklec")
+
+    def load(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                return pickle.loads(zlib.decompress(f.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            return None
+
+    def save(self, key, script):
+        if self.directory is None:
+            return
+        # written next to the target and renamed, so concurrent readers never see half a file
+        path = self.path(key)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(zlib.compress(pickle.dumps(script, pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp, path)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.disk_hits = 0
+
+
+class Interpreter:
+    def __init__(self, code, backend="tree", cache=None, optimize=True, memoize=False, memo_size=1024, limits=None):
+        """memoize caches the results of pure functions, see analyze_purity, in an LRU cache of memo_size
+        entries per closure. limits is a Limits every run has to keep to, for running untrusted code.
+        The tree, python, closure and flat backends recurse in python for nested calls, so only the vm can go deeper
+        than the python stack"""
+        if backend not in backends:
+            raise ValueError("Unknown backend {!r}, expected one of {}".format(backend, backends))
+        if memoize and backend != "tree":
+            raise ValueError("memoize needs the tree backend")
+        self.backend = backend
+        if cache is None:
+            script = CompiledScript(code, optimize)
+            script.compile(backend)
+        else:
+            script = cache.get(code, backend, optimize)
+        self.ast = script.ast
+        self.program = script.program
+        self.flat = script.flat
+        # code objects and closures do not pickle, so each Interpreter builds its own from the cached script
+        self.native = None
+        if backend == "python":
+            # the cached source has no limit checks, a limited one is compiled for this Interpreter alone
+            source = PythonCompiler(limited=True).compile(script.ast) if limits is not None else script.python
+            try:
+                self.native = load_python(source, limits)
+            except (SyntaxError, RecursionError):
+                # nested deeper than python's parser or compiler goes, the closures run the same program
+                self.native = ClosureCompiler(limits).compile(script.ast)
+        elif backend == "closure":
+            self.native = ClosureCompiler(limits).compile(script.ast)
+        self.limits = limits
+        # ast size (before, after) optimizing, None when optimize is off
+        self.node_counts = script.node_counts
+        # the tree that is run, a copy of the ast for modes that need different nodes
+        self.tree = memoizing(self.ast) if memoize else self.ast
+        # the copy of the ast that batches run on in one pass, made by the first of them, see run_columns
+        self.batch_tree = None
+        self.memo_size = memo_size
+        self.memo_caches = []
+        self.impure_calls = 0
+        self.hook = None
+        self.traced = None
+        self.code = code
+        self.profiler = None
+
+    def attach(self, hook):
+        """runs the tree through hook from now on, see Hook"""
+        if self.backend != "tree":
+            raise ValueError("hooks need the tree backend")
+        self.hook = hook
+        self.traced = instrument(self.tree, hook)
+
+    def detach(self):
+        self.hook = None
+        self.traced = None
+
+    def profile(self, profiler=None):
+        """profiles every run from now on with profiler, a new Profiler by default, and returns it.
+        profile(False) stops profiling"""
+        if profiler is False:
+            self.profiler = None
+            return None
+        if self.backend != "tree":
+            raise ValueError("the profiler needs the tree backend")
+        self.profiler = profiler or Profiler()
+        return self.profiler
+
+    def run(self, bindings=None):
+        """bindings maps global names to values, python callables among them can be called as functions"""
+        # the ast is never mutated while running, all execution state lives in the frames, only the class
+        # of a MultiExpressionNode changes with what its operands turn out to be, see MultiExpressionNode.run
+        # so every run starts from a fresh global frame and the same tree can be run any number of times
+        self.globals = self.global_frame(bindings)
+        self.frame = self.globals
+        self.memo_caches = []
+        self.impure_calls = 0
+        if self.limits is not None:
+            self.limits.reset(self.ast.nslots)
+        if self.backend == "vm":
+            return VM().run(self.program, self.globals, self.limits)
+        if self.backend in ("python", "closure"):
+            return self.native(self.globals)
+        if self.backend == "flat":
+            return self.flat.run(self.globals, self.limits)
+        tree = self.traced if self.hook is not None else self.tree
+        if self.profiler is not None:
+            self.profiler.start(self)
+            try:
+                return tree.run(self)
+            finally:
+                self.profiler.stop()
+        # for each node
+        # node takes care of execution of subexpressions
+        # node.run(interpreter) returns result
+        # uses interpreter to access scopes
+        # for instance look at Root.run(interpreter) to see how it executes
+        # note: code for execution could be put in to visit with dynamic dispatch based on visitor class
+        return tree.run(self)
+
+    async def run_async(self, bindings=None, every=100):
+        """Runs like run without blocking the event loop, handing control back to it every that many calls,
+        so any number of scripts can share one loop. Host functions may be coroutine functions, their results
+        are awaited. Whatever the backend, this runs on the vm, compiling the bytecode on first use"""
+        if every < 1:
+            raise ValueError("every has to be at least 1")
+        if self.program is None:
+            self.program = BytecodeCompiler().compile(self.ast)
+        self.globals = self.global_frame(bindings)
+        self.frame = self.globals
+        if self.limits is not None:
+            self.limits.reset(self.ast.nslots)
+        steps = VM().execute(self.program, self.globals, self.limits, every)
+        result = None
+        while True:
+            try:
+                awaitable = steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            if awaitable is None:
+                result = None
+                await asyncio.sleep(0)
+            else:
+                result = await awaitable
+
+    def run_batch(self, bindings):
+        """runs the program once for every row of bindings and returns a numpy array of the results.
+        The numpy arrays among the values of bindings are columns of equal length, every other value is shared by all rows.
+        The batch is first evaluated in one pass on the tree with the arithmetic working elementwise on whole columns.
+        It is run row by row instead if that calls a host function not marked with vectorized, divides by zero,
+        or does not return numbers, and when a hook is attached. numpy's integers wrap around on overflow where
+        python's grow, so a batch with integer columns is checked against a second pass in floats, see run_vectorized"""
+        import numpy as np
+
+        columns = {name: value for name, value in bindings.items() if isinstance(value, np.ndarray)}
+        if not columns:
+            raise ValueError("run_batch needs at least one numpy array among the bindings")
+        lengths = {column.shape for column in columns.values()}
+        if len(lengths) != 1 or len(next(iter(lengths))) != 1:
+            raise ValueError("columns must be one dimensional arrays of the same length, got shapes {}".format(lengths))
+        (rows,) = lengths.pop()
+        if self.hook is None:
+            result = self.run_vectorized(bindings, np)
+            if result is not None and result.shape in ((), (rows,)):
+                return np.broadcast_to(result, (rows,)).copy()
+        names = list(columns)
+        row = dict(bindings)
+        results = []
+        # tolist gives python numbers, so every row runs exactly like a call to run would
+        for values in zip(*(columns[name].tolist() for name in names)):
+            row.update(zip(names, values))
+            results.append(self.run(row))
+        return np.array(results)
+
+    def run_vectorized(self, bindings, np):
+        """evaluates a whole batch in one pass, returns None if it has to be run row by row.
+        Integer columns are also evaluated as floats, which go to inf where ints would wrap around, and if the
+        two passes differ by more than the rounding of floats some row overflowed, so the batch is run row by row"""
+        bindings = {
+            name: scalar_only(value) if callable(value) and not getattr(value, "sparkle_vectorized", False) else value
+            for name, value in bindings.items()
+        }
+        result = self.run_columns(bindings, np)
+        integers = [name for name, value in bindings.items() if isinstance(value, np.ndarray) and value.dtype.kind in "iu"]
+        if result is None or not integers:
+            return result
+        floats = dict(bindings)
+        for name in integers:
+            floats[name] = bindings[name].astype(np.float64)
+        check = self.run_columns(floats, np)
+        if check is None or not np.allclose(result, check, rtol=1e-9, atol=0):
+            return None
+        return result
+
+    def run_columns(self, bindings, np):
+        # a copy of the plain ast, memoizing needs hashable arguments and the vm only the bytecode,
+        # and the arithmetic sites of the ast would go generic for good on seeing arrays
+        if self.batch_tree is None:
+            self.batch_tree = copy_tree(self.ast, lambda clone, node: clone)
+        self.globals = self.global_frame(bindings)
+        self.frame = self.globals
+        self.memo_caches = []
+        self.impure_calls = 0
+        if self.limits is not None:
+            self.limits.reset(self.ast.nslots)
+        try:
+            with np.errstate(divide="raise", invalid="raise", over="ignore"):
+                result = np.asarray(self.batch_tree.run(self))
+        except (NotVectorizable, FloatingPointError, ZeroDivisionError):
+            return None
+        # bool, int, unsigned and float, anything else like closures or None differs from row to row
+        return result if result.dtype.kind in "biuf" else None
+
+    def memo_stats(self):
+        """hits, misses and cached results of every memoized function in the last run, keyed by its let name"""
+        stats = {}
+        for function, memo in self.memo_caches:
+            entry = stats.setdefault(function.name or "<fn>", {"hits": 0, "misses": 0, "size": 0})
+            entry["hits"] += memo.hits
+            entry["misses"] += memo.misses
+            entry["size"] += len(memo.entries)
+        return stats
+
+    def global_frame(self, bindings):
+        return global_frame(self.ast.nslots, self.ast.symbols, self.ast.free, bindings)
+
+
+def global_frame(nslots, symbols, free, bindings):
+    """a global frame of nslots with bindings in the slots symbols gives them, every name of free has to be bound"""
+    frame = [None] * (nslots + 1)
+    if bindings:
+        for name, value in bindings.items():
+            if name in symbols:
+                frame[symbols[name]] = value
+    for name in free:
+        if not bindings or name not in bindings:
+            raise NameError("name {!r} is not defined".format(name))
+    return frame
+
+
+def test_string(codestring):
+    interpreter = Interpreter(codestring)
+    print("ast =", AstPrinter().tostring(interpreter.ast))
+    rval = interpreter.run()
+    print("nodes before and after optimizing =", interpreter.node_counts)
+    assert Interpreter(codestring, optimize=False).run() == rval
+    for backend in backends:
+        assert Interpreter(codestring, backend).run() == rval, backend
+    return rval
+
+
+def print_and_return_value(codestring, prefix="rval ="):
+    rval = test_string(codestring)
+    codestring = "> " + codestring
+    print(codestring.replace("\n", "\n> "))
+    print(prefix, rval)
+    print("\n")
+    return rval
+
+
+def bench_rerun(sizes=(10, 100, 1000), number=200):
+    """Times repeated runs of scripts that do the same work but carry a dead function of growing size,
+    run cost should stay flat as the ast grows"""
+    results = {}
+    for size in sizes:
+        dead = "\n".join("    let v{0} = a * {0} + 1".format(i) for i in range(size))
+        code = "let unused = fn(a) -> {{\n{}\n}}\nlet f = fn(a, b) -> {{ return 2 * a + b }}\nreturn f(3, 4)".format(dead)
+        for backend in backends:
+            interpreter = Interpreter(code, backend)
+            seconds = timeit.timeit(interpreter.run, number=number)
+            results[(backend, size)] = seconds / number
+            print("{:>5} statements, {:>4}: {:.2f} us/run".format(size, backend, seconds / number * 1e6))
+    return results
+
+
+def bench_backends(number=20000):
+    """Times every backend on arithmetic heavy programs from main"""
+    programs = (
+        "return 2 * 3 * 4 + 5 * 6 / (7*9 - 8*8)",
+        """let f1 = fn (a, b) -> { return 2 * a + b }
+let f2 = fn (a, b, c) -> { return 3*a*b - c }
+return f1(5, 69) - f2(4,3,2)
+""",
+        """let x = 5
+let foo = fn(x, y) ->
+    x + y
+let bar = fn(func, x) -> {
+    return func(x, x + 1) + func(x + 1, x + 2)
+}
+return bar(foo, x)""",
+    )
+    results = {}
+    for i, code in enumerate(programs):
+        for backend in backends:
+            interpreter = Interpreter(code, backend)
+            seconds = timeit.timeit(interpreter.run, number=number)
+            results[(backend, i)] = seconds / number
+            print("program {}, {:>7}: {:.2f} us/run".format(i, backend, seconds / number * 1e6))
+    return results
+
+
+def bench_parser(depth=10000, statements=1000000, expressions=50000):
+    """Times parsing blocks nested depth deep, a script of many statements and one of dense expressions,
+    with the tokens per second"""
+    results = {}
+    sources = {
+        "nested": "{" * depth + "let x = 1" + "}" * depth,
+        "statements": "let x = x + 1 * 2;\n" * statements,
+        "expressions": "let x = (a + b * 3 - c % 7) * f(d, e / 2) + g(1) * 2 - h;\n" * expressions,
+    }
+    for name, code in sources.items():
+        start = timeit.default_timer()
+        parser = Parser(code)
+        parser.parse()
+        seconds = timeit.default_timer() - start
+        ntokens = len(parser.positions)
+        results[name] = seconds
+        print("{:>11}: {} tokens in {:.2f} s, {:.0f} tokens/s".format(name, ntokens, seconds, ntokens / seconds))
+    return results
+
+
+def bench_reparse(sizes=(1000, 10000, 100000)):
+    """Times Parser.reparse after a one character edit in the middle of a script against parsing it again"""
+    results = {}
+    for size in sizes:
+        code = "let x = x + 1 * 2;\n" * size
+        root = Parser(code).parse()
+        pos = code.index("1", len(code) // 2)
+        edited = code[:pos] + "7" + code[pos + 1 :]
+        start = timeit.default_timer()
+        Parser(edited).reparse(root, Edit(pos, pos + 1, "7"))
+        incremental = timeit.default_timer() - start
+        start = timeit.default_timer()
+        Parser(edited).parse()
+        full = timeit.default_timer() - start
+        results[size] = (incremental, full)
+        print("{:>6} statements: reparse {:.4f} s, parse {:.4f} s".format(size, incremental, full))
+    return results
+
+
+def bench_async(scripts=1000, calls=1000, every=100):
+    """Runs scripts counting down from calls concurrently on one event loop against one run alone.
+    A heartbeat task reports the longest it waited for the loop, a round of every script running every calls"""
+    code = """let count = fn(n, acc) -> {
+    let next = pick(n, count, done)
+    return next(n - 1, acc + 1)
+}
+let done = fn(n, acc) -> acc
+return count(n, 0)
+"""
+    pick = lambda n, a, b: a if n > 0 else b
+    interpreter = Interpreter(code, "vm")
+
+    async def heartbeat(gaps, finished):
+        last = timeit.default_timer()
+        while not finished:
+            await asyncio.sleep(0)
+            now = timeit.default_timer()
+            gaps.append(now - last)
+            last = now
+
+    async def bench():
+        gaps = []
+        finished = []
+        beat = asyncio.ensure_future(heartbeat(gaps, finished))
+        runs = [Interpreter(code, "vm").run_async({"pick": pick, "n": calls}, every) for _ in range(scripts)]
+        results = await asyncio.gather(*runs)
+        finished.append(True)
+        await beat
+        assert results == [calls + 1] * scripts
+        return max(gaps)
+
+    start = timeit.default_timer()
+    interpreter.run({"pick": pick, "n": calls})
+    alone = timeit.default_timer() - start
+    start = timeit.default_timer()
+    gap = asyncio.run(bench())
+    seconds = timeit.default_timer() - start
+    print(
+        "{} scripts of {} calls: {:.2f} s on one loop, {:.4f} s for one run, longest heartbeat wait {:.4f} s".format(
+            scripts, calls, seconds, alone, gap
+        )
+    )
+    return seconds, gap
+
+
+def bench_tokenizer(repeat=2000, number=3):
+    """Tokens per second of the lazy tokenize generator and of Parser.tokenizer, which also builds the parser's nodes.
+    The tokenizer these replaced is the tokenizer_baseline case of sparkle.bench"""
+    code = """let make = fn(a) -> { let b = a * 2 return fn(c) -> { return fn(d) -> a + b + c + d } }
+/* a comment */
+let g = make(1)
+let h = g(10)
+h(100) % 7
+""" * repeat
+    ntokens = sum(1 for _ in tokenize(code))
+    results = {}
+    for name, lex in (("tokenize", lambda: sum(1 for _ in tokenize(code))), ("Parser.tokenizer", lambda: Parser(code).tokenizer(code))):
+        seconds = timeit.timeit(lex, number=number) / number
+        results[name] = ntokens / seconds
+        print("{:>16}: {:,.0f} tokens/s".format(name, ntokens / seconds))
+    return results
+
+
+def bench_tail_calls(sizes=(10000, 100000, 1000000)):
+    """Times a tail recursive countdown, peak memory should not grow with the number of calls"""
+    import tracemalloc
+
+    code = """let loop = fn(n, acc) -> {
+    let next = pick(n, loop, done)
+    return next(n - 1, acc + 1)
+}
+let done = fn(n, acc) -> acc
+return loop(count, 0)
+"""
+    bindings = {"pick": lambda n, a, b: a if n > 0 else b}
+    results = {}
+    for backend in backends:
+        interpreter = Interpreter(code, backend)
+        for size in sizes:
+            bindings["count"] = size
+            start = timeit.default_timer()
+            assert interpreter.run(bindings) == size + 1
+            seconds = timeit.default_timer() - start
+            # measured on a second run, tracing allocations slows the interpreter down several times
+            tracemalloc.start()
+            interpreter.run(bindings)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[(backend, size)] = (seconds, peak)
+            print("{:>8} calls, {:>4}: {:.2f} s, peak {:,} bytes".format(size, backend, seconds, peak))
+    return results
+
+
+def bench_memoize(counts=(10, 15, 20, 25)):
+    """Times a doubly recursive fibonacci with and without memoize"""
+    code = """let fib = fn(n) -> {
+    let next = pick(n - 1, recurse, identity)
+    return next(n)
+}
+let recurse = fn(n) -> fib(n - 1) + fib(n - 2)
+let identity = fn(n) -> n
+return fib(count)
+"""
+    pick = pure(lambda n, a, b: a if n > 0 else b)
+    results = {}
+    for memoize in (False, True):
+        interpreter = Interpreter(code, memoize=memoize)
+        for count in counts:
+            start = timeit.default_timer()
+            interpreter.run({"pick": pick, "count": count})
+            seconds = timeit.default_timer() - start
+            results[(memoize, count)] = seconds
+            print("fib({:>2}), memoize={!s:<5}: {:.4f} s".format(count, memoize, seconds))
+    return results
+
+
+def bench_profiler(count=20, repeat=15):
+    """The cost of profiling a doubly recursive fibonacci, runs with and without the profiler take turns
+    and the fastest of each is compared"""
+    code = """let fib = fn(n) -> {
+    let next = pick(n - 1, recurse, identity)
+    return next(n)
+}
+let recurse = fn(n) -> fib(n - 1) + fib(n - 2)
+let identity = fn(n) -> n
+return fib(count)
+"""
+    bindings = {"pick": lambda n, a, b: a if n > 0 else b, "count": count}
+    plain = Interpreter(code)
+    profiled = Interpreter(code)
+    profiler = profiled.profile()
+    times = {plain: [], profiled: []}
+    for _ in range(repeat):
+        for interpreter in times:
+            start = timeit.default_timer()
+            interpreter.run(bindings)
+            times[interpreter].append(timeit.default_timer() - start)
+    without, with_ = min(times[plain]), min(times[profiled])
+    print("fib({}): {:.4f} s, profiled {:.4f} s, {:+.1%}, {} samples".format(count, without, with_, with_ / without - 1, profiler.samples))
+    return without, with_
+
+
+def bench_batch(sizes=(1000, 10000, 100000)):
+    """Compares run_batch over numpy columns to calling run for every row"""
+    import numpy as np
+
+    code = """let scale = fn(v) -> v * factor
+let x = scale(a) + 3 * b
+return x * x - (a + 1) / 2
+"""
+    interpreter = Interpreter(code)
+    results = {}
+    for size in sizes:
+        a = np.arange(size)
+        b = np.arange(size) % 7
+        start = timeit.default_timer()
+        batch = interpreter.run_batch({"a": a, "b": b, "factor": 3})
+        vectorized = timeit.default_timer() - start
+        start = timeit.default_timer()
+        rows = [interpreter.run({"a": x, "b": y, "factor": 3}) for x, y in zip(a.tolist(), b.tolist())]
+        per_row = timeit.default_timer() - start
+        assert batch.tolist() == rows
+        results[size] = (vectorized, per_row)
+        print("{:>7} rows: run_batch {:.4f} s, run per row {:.4f} s".format(size, vectorized, per_row))
+    return results
+
+
+def main():
+    assert 6 == print_and_return_value("""return 2*3""")
+    assert 10 == print_and_return_value(  # testing multiline statements
+        """let x = 10
+return x
+"""
+    )
+    assert 69 == print_and_return_value(  # testing multiple let statements
+        """let x = 10
+let b = 2 * x + 3
+return b * 3
+"""
+    )
+    assert 17 == print_and_return_value(  # testing order of ops
+        """let x = 10
+let b = 3 + 2 * x
+return b - 2 * 3
+"""
+    )
+    assert 79 - 34 == print_and_return_value(  # testing functions
+        """let f1 = fn (a, b) -> { return 2 * a + b }
+let f2 = fn (a, b, c) -> { return 3*a*b - c }
+return f1(5, 69) - f2(4,3,2)
+"""
+    )
+    assert 5 + 6 + 6 + 7 == print_and_return_value(
+        """
+let x = 5
+let foo = fn(x, y) ->
+    x + y
+/* Long function */
+let bar = fn(func, x) -> {
+    return func(x, x + 1) + func(x + 1, x + 2)
+}
+return bar(foo, x)"""
+    )
+    assert -6.0 == print_and_return_value(  # testing multiple multiplications and stuff
+        """return 2 * 3 * 4 + 5 * 6 / (7*9 - 8*8)
+"""
+    )
+    assert -3 == print_and_return_value(  # testing semicolons
+        """let x = 2 * 3;
+return 3 - x;
+"""
+    )
+    assert 9 == print_and_return_value(  # testing multiple assignment
+        """let x = 10*3
+let y = 9
+x = y = 3
+return x*y
+"""
+    )
+    assert 4 == print_and_return_value(  # testing modulo
+        """let x = 7
+return x % 3 + 10 % x
+"""
+    )
+    assert 8 == print_and_return_value(  # testing semicolons in blocks
+        """let f = fn(a) -> { let y = a * 2; return y; };
+return f(4)
+"""
+    )
+    assert 8 == print_and_return_value(  # testing functions that call locals declared after them
+        """let outer = fn(a) -> {
+ let g = fn(b) -> h(b) * 2
+ let h = fn(c) -> c + 1
+ return g(a) }
+return outer(3)"""
+    )
+    assert 13 == print_and_return_value(  # testing a local read before its let, which still sees the global
+        """let x = 1
+let f = fn(a) -> { let y = x + a
+let x = 10
+return y + x }
+return f(2)"""
+    )
+    code = "let x = 1\nlet y = x + 2\nreturn y"  # testing incremental parsing
+    edited, changed = Parser(code.replace("2", "3 * x")).reparse(Parser(code).parse(), Edit(22, 23, "3 * x"))
+    assert AstPrinter().tostring(edited) == AstPrinter().tostring(Parser(code.replace("2", "3 * x")).parse())
+    assert len(changed) == 1 and changed[0] is edited.statements[1]
+    async def fetch(x):  # testing async runs, interleaved on one loop
+        await asyncio.sleep(0)
+        return x * 2
+
+    async def run_all(code, count):
+        return await asyncio.gather(*(Interpreter(code).run_async({"fetch": fetch, "x": x}, every=1) for x in range(count)))
+
+    assert [41 + 2 * x + 1 for x in range(10)] == asyncio.run(run_all("let f = fn(n) -> fetch(n) + 1\nreturn f(20) + f(x)", 10))
+    # testing deep nesting, deeper than python's parser goes, the python backend falls back to closures for it
+    assert 151 == test_string("let f = fn(a) -> a + 1\nreturn " + "f(" * 150 + "1" + ")" * 150)
+    # and chains longer than python's compiler takes in one expression or the stack in nested closures
+    assert 5000 == test_string("let x = 1\nreturn " + " + ".join(["x * 2 - 1"] * 5000))
+    assert 3000 == test_string("let x = 2\nreturn " + " + ".join(["x"] * 1500))
+    for backend in backends:  # testing limits
+        try:
+            Interpreter("let f = fn(n) -> 1 + f(n)\nreturn f(1)", backend, limits=Limits(max_depth=100)).run()
+        except LimitExceeded as e:
+            assert (e.limit, e.depth) == ("depth", 101), e
+        else:
+            raise AssertionError("unbounded recursion should exceed the depth limit")
+    try:  # testing syntax errors
+        Parser("let x = 1\nreturn (x + 2").parse()
+    except SyntaxError as e:
+        assert (e.lineno, e.offset) == (2, 14), e
+    else:
+        raise AssertionError("an unclosed parenthesis should not parse")
+    # testing flat trees, through their bytes and back
+    interpreter = Interpreter("let f = fn(a, b) -> { a = a * (5 / 2); return b(a) }\nreturn f(x, fn(v) -> v - 1) + 3", "flat")
+    flat = FlatTree.from_buffer(interpreter.flat.to_bytes())
+    assert type(flat.kinds) is memoryview and len(flat) == len(interpreter.flat)
+    bindings = {"x": 2}
+    assert 7.0 == flat.run(interpreter.global_frame(bindings)) == interpreter.run(bindings)
+    assert 7.0 == pickle.loads(pickle.dumps(flat)).run(interpreter.global_frame(bindings))
+    # testing streams, statements run as they complete with the globals kept between them
+    from sparkle.stream import Stream
+
+    stream = Stream({"k": 10})
+    assert [] == stream.feed("let f = fn(a) -> {\n  return g(a) + ")
+    assert [None] == stream.feed("k\n}\nlet g = fn(a) -> a * 2")
+    assert [None, 16] == stream.feed("\nf(3)\n")
+    assert [56] == stream.feed("return f(23)\nf(0)\n") and stream.done and stream.value == 56
+    stream = Stream()
+    try:
+        stream.feed("let a = 1\n\nlet b = (a +\n  2 *)\n")
+    except SyntaxError as e:
+        assert (e.lineno, e.offset) == (4, 6) and "at line 4 column 6" in e.msg, e
+    else:
+        raise AssertionError("an operator without its operand should not parse")
+    # testing program images, mapped from a file
+    import tempfile
+
+    code = "let f = fn(a, b) -> { let s = a * b; return s / 4 }\nlet g = fn(x) -> f(x, y + 1 / 2 - 1 / 2)\nreturn g(3) + z"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "script.sparki")
+        ProgramImage.compile(code).save(path)
+        with ProgramImage.open(path) as image:
+            assert type(image.program.code) is memoryview
+            assert 4.5 == image.run({"y": 2, "z": 3}) == Interpreter(code).run({"y": 2, "z": 3})
+    # testing pools of worker processes, a job that raises gives a JobError with what is needed to report it
+    from sparkle.pool import JobError, Pool
+
+    with Pool(1, limits=Limits(max_depth=50)) as pool:
+        results = pool.map(
+            [
+                ("return x * 2", {"x": 21}),
+                ("return y + 1", None),
+                ("let x = 1\nreturn (x + 2", None),
+                ("let f = fn(n) -> 1 + f(n)\nreturn f(1)", None),
+            ]
+        )
+    assert 42 == results[0]
+    assert all(type(result) is JobError for result in results[1:]), results
+    assert results[1].kind == "NameError", results[1]
+    assert (results[2].kind, results[2].line, results[2].column) == ("SyntaxError", 2, 14), results[2]
+    assert (results[3].kind, results[3].limit, results[3].depth) == ("LimitExceeded", "depth", 51), results[3]
+    # testing the program cache, least recently used scripts make way in memory but are loaded back from disk
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ProgramCache(maxsize=2, directory=tmp)
+        scripts = ["return {} * x + 1".format(n) for n in range(3)]
+        for code in scripts + scripts[2:]:
+            Interpreter(code, cache=cache)
+        assert (cache.hits, cache.misses, cache.disk_hits, len(cache)) == (1, 3, 0, 2), cache
+        assert 1 == Interpreter(scripts[0], cache=cache).run({"x": 5})
+        assert (cache.hits, cache.misses, cache.disk_hits, len(cache)) == (1, 3, 1, 2), cache
+        reloaded = ProgramCache(directory=tmp)
+        for backend in backends:
+            assert 4 == Interpreter(scripts[1], backend, cache=reloaded).run({"x": 3})
+        assert (reloaded.hits, reloaded.misses, reloaded.disk_hits) == (len(backends) - 1, 0, 1), reloaded
+    # testing inline caches, a call site follows its variable to another function
+    assert 22 == print_and_return_value(
+        """let f = fn(x) -> x + 1
+let g = fn(x) -> f(x)
+let a = g(1)
+f = fn(x) -> x * 10
+return a + g(2)"""
+    )
+    # testing type feedback, an int site gets an int handler that falls back to the generic one for other types
+    interpreter = Interpreter("let f = fn(a, b) -> a * b + 1 - a\nreturn f(x, y) / 2")
+    body = interpreter.ast.statements[0].expression.statements
+    assert 2.5 == interpreter.run({"x": 2, "y": 3})
+    assert (type(body), type(body.nodes[0])) == (IntChainNode, IntMulNode), body
+    assert 1.25 == interpreter.run({"x": 1.5, "y": 2})
+    assert (type(body), type(body.nodes[0])) == (GenericExpressionNode, GenericExpressionNode), body
+    assert 2.5 == interpreter.run({"x": 2, "y": 3})
+    # testing the profiler, the counts are exact while the times are sampled
+    interpreter = Interpreter("""let twice = fn(f, x) -> f(f(x))
+let inc = fn(x) -> x + 1
+return twice(inc, 1) + twice(fn(x) -> x * 3, 1)""")
+    profiler = interpreter.profile()
+    assert 12 == interpreter.run()
+    summary = json.loads(profiler.to_json())
+    counts = {(f["name"], f["line"]): (f["calls"], f["closures"]) for f in summary["functions"]}
+    assert counts == {("twice", 1): (2, 1), ("inc", 2): (2, 1), (None, 3): (2, 1)}, counts
+    assert all(line.startswith("<script>") for line in profiler.collapsed().splitlines())
+    # a function that is still running when sampled is on the stacks, the call through the cache included
+    interpreter = Interpreter("let slow = fn(x) -> pause(x) + 1\nlet twice = fn(x) -> slow(x) + slow(x)\nreturn twice(1)")
+    profiler = interpreter.profile(Profiler(interval=0.001))
+    assert 4 == interpreter.run({"pause": lambda x: threading.Event().wait(0.02) or x})
+    cumulative = {f["name"]: f["cumulative"] for f in profiler.summary()["functions"]}
+    assert 0.75 * cumulative["twice"] < cumulative["slow"] <= cumulative["twice"], cumulative
+    assert profiler.collapsed().startswith("<script>;twice:2;slow:1 "), profiler.collapsed()
+    interpreter.profile(False)
+    # testing hooks, every node is seen on the way in and out, the body of a called function nested in the call
+    import io
+
+    interpreter = Interpreter("let f = fn(a) -> a * 3\nlet b = f(x) + 1\nreturn b")
+    trace = io.StringIO()
+    interpreter.attach(TraceHook(trace))
+    assert 7 == interpreter.run({"x": 2})
+    assert trace.getvalue().splitlines() == [
+        "((ID f) = (F (L (ID a)) ((ID a) <*> 3)))",
+        "  (F (L (ID a)) ((ID a) <*> 3))",
+        "  -> <Closure <fn>>",
+        "-> None",
+        "((ID b) = ((FC (ID f) (ID x)) <+> 1))",
+        "  ((FC (ID f) (ID x)) <+> 1)",
+        "    (FC (ID f) (ID x))",
+        "      (ID f)",
+        "      -> <Closure <fn>>",
+        "      (ID x)",
+        "      -> 2",
+        "      ((ID a) <*> 3)",
+        "        (ID a)",
+        "        -> 2",
+        "        3",
+        "        -> 3",
+        "      -> 6",
+        "    -> 6",
+        "    1",
+        "    -> 1",
+        "  -> 7",
+        "-> None",
+        "(RT (ID b))",
+        "  (ID b)",
+        "  -> 7",
+        "-> 7",
+    ], trace.getvalue()
+    interpreter.detach()
+    assert 7 == interpreter.run({"x": 2}) and trace.getvalue().count("\n") == 26
+    # testing hooks on calls in tail position, an instrumented tree makes them in place so the hook sees their values
+
+    class CallHook(Hook):
+        def __init__(self):
+            self.calls = []
+
+        def exit(self, interpreter, node, value):
+            if node.op is T.FCALL:
+                self.calls.append((node.fn.identifier, value))
+
+    interpreter = Interpreter("let f = fn(a) -> g(a)\nreturn f(3)")
+    hook = CallHook()
+    interpreter.attach(hook)
+    assert 6 == interpreter.run({"g": lambda a: a * 2})
+    assert hook.calls == [("g", 6), ("f", 6)], hook.calls
+    interpreter.detach()
+    # testing memoize, calls to pure functions reuse the results of earlier calls with the same arguments of the same types
+    interpreter = Interpreter(
+        """let fib = fn(n) -> {
+    let next = pick(n - 1, recurse, identity)
+    return next(n)
+}
+let recurse = fn(n) -> fib(n - 1) + fib(n - 2)
+let identity = fn(n) -> n
+return fib(20)""",
+        memoize=True,
+    )
+    assert 6765 == interpreter.run({"pick": pure(lambda n, a, b: a if n > 0 else b)})
+    assert interpreter.memo_stats() == {"fib": {"hits": 18, "misses": 20, "size": 20}}, interpreter.memo_stats()
+    interpreter = Interpreter("let twice = fn(a) -> a * 2\nreturn pair(twice(x), twice(y))", memoize=True)
+    value = interpreter.run({"pair": pure(lambda a, b: (a, b)), "x": 2, "y": 2.0})
+    assert value == (4, 4.0) and type(value[1]) is float, value
+    # f reads a global that is assigned later and g calls a host function not marked pure, neither is kept
+    interpreter = Interpreter(
+        "let k = 1\nlet f = fn(a) -> a + k\nlet g = fn(a) -> now(a)\nlet a = f(1) + f(1) + g(1) + g(1)\nk = 2\nreturn a + f(1)",
+        memoize=True,
+    )
+    assert 9 == interpreter.run({"now": lambda a: a})
+    assert interpreter.memo_stats() == {"g": {"hits": 0, "misses": 2, "size": 0}}, interpreter.memo_stats()
+    # counter returns a closure over a variable that closure assigns, every call has to make a new one
+    interpreter = Interpreter(
+        """let counter = fn(start) -> { let n = start
+ return fn(d) -> n = n + d }
+let c1 = counter(0)
+let c2 = counter(0)
+c1(1)
+c1(1)
+return c2(1)""",
+        memoize=True,
+    )
+    assert 1 == interpreter.run() and "counter" not in interpreter.memo_stats(), interpreter.memo_stats()
+    # g is called before the let of k, global or local to a function, while k is still None
+    for code in (
+        "let g = fn(b) -> pair(b, k)\nlet r1 = g(1)\nlet k = 5\nreturn pair(r1, g(1))",
+        "let f = fn(z) -> {\n let g = fn(b) -> pair(b, k)\n let r1 = g(1)\n let k = 5\n return pair(r1, g(1)) }\nreturn f(0)",
+    ):
+        interpreter = Interpreter(code, memoize=True)
+        assert ((1, None), (1, 5)) == interpreter.run({"pair": pure(lambda a, b: (a, b))}), code
+        assert "g" not in interpreter.memo_stats(), interpreter.memo_stats()
+    try:
+        import numpy as np
+    except ImportError:
+        pass
+    else:  # testing batches, in one pass and row by row
+        columns = {"a": np.array([1, 2, 3]), "b": np.array([4, 0, 2])}
+        assert [5.5, 3.0, 6.5] == Interpreter("return 2*a + b - a/2").run_batch(columns).tolist()
+        try:
+            Interpreter("return a / b").run_batch(columns)
+        except ZeroDivisionError:
+            pass
+        else:
+            raise AssertionError("dividing by a zero in a column should raise like the row by row run")
+        pick = lambda n, x, y: x if n > 0 else y
+        assert [1, 0, 3] == Interpreter("return pick(b, a, b)").run_batch(dict(columns, pick=pick)).tolist()
+        # int64 wraps around at 2 ** 63, a batch that gets there is run row by row with python's ints
+        columns = {"a": np.array([100000, 3])}
+        assert [10**20, 81] == Interpreter("return a*a*a*a").run_batch(columns).tolist()
+        assert [5 * 10**19, 40.5] == Interpreter("return a*a*a*a / 2").run_batch(columns).tolist()
+        # the one pass runs on its own copy of the tree, the sites of the ast keep their int handlers
+        interpreter = Interpreter("let f = fn(a, b) -> a * b + 1\nreturn f(x, 3)")
+        body = interpreter.ast.statements[0].expression.statements
+        assert 7 == interpreter.run({"x": 2}) and type(body) is IntAddNode, body
+        assert [4, 7] == interpreter.run_batch({"x": np.array([1, 2])}).tolist()
+        batch_body = interpreter.batch_tree.statements[0].expression.statements
+        assert (type(body), type(batch_body)) == (IntAddNode, GenericExpressionNode), (body, batch_body)
+
+
+if __name__ == "__main__":
+    main()
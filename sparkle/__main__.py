@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+# @File Name: sparkle/__main__.py
+# runs the Sparkle tests with python -m sparkle
+
+from sparkle import main
+
+main()
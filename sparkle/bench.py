@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+# @File Name: sparkle/bench.py
+# benchmarks of the interpreter with machine readable results, and the comparison of two runs of them
+
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from collections import OrderedDict
+
+from sparkle import (
+    Constant,
+    FlatTree,
+    Function,
+    Identifier,
+    Interpreter,
+    LetStatement,
+    Node,
+    Op,
+    Parser,
+    ProgramImage,
+    ReturnStatement,
+    T,
+    backends,
+    token_regexs,
+)
+
+# every case is called with a scale and returns (run, ops, unit), where run does ops of unit once,
+# in the order they are run
+cases = OrderedDict()
+
+
+def case(name):
+    def register(f):
+        cases[name] = f
+        return f
+
+    return register
+
+
+def generated_script(statements):
+    """a script of that many top level statements, a function every tenth and arithmetic on calls to it otherwise"""
+    lines = ["let x0 = 1"]
+    last = 0
+    for i in range(1, statements - 1):
+        if i % 10 == 1:
+            lines.append("let f{} = fn(a, b) -> a * {} + b".format((i - 1) // 10, i % 7 + 1))
+        else:
+            lines.append("let x{0} = f{1}({0}, {2}) % 97 + (x{3} - {0}) / 3".format(i, (i - 1) // 10, i % 13, last))
+            last = i
+    lines.append("return x{}".format(last))
+    return "\n".join(lines)
+
+
+@case("tokenizer")
+def tokenizer_case(scale):
+    code = generated_script(20000 * scale)
+    parser = Parser(code)
+    return (lambda: parser.tokenizer(code)), len(parser.tokenizer(code)), "tokens"
+
+
+def baseline_tokenizer(code):
+    """Parser.tokenizer as it was before token_pattern, for the tokenizer case to be compared against.
+    It builds the pattern on every call and tells tokens apart by their text, the parenthesis and brace tables
+    it also built are kept, only the debug prints are gone"""
+    tok_regex = "|".join(
+        "(?P<{}>{})".format(k, v) for k, v in dict(token_regexs, Return="return", Let="let", Fn="fn").items()
+    )
+    tokens = []
+    parens = []
+    braces = []
+    ptable = {}
+    btable = {}
+    i = 0
+    for retoken in re.finditer(tok_regex, code):
+        kind = retoken.lastgroup
+        token = retoken.group(kind)
+        if token == "" or kind == "Whitespace" or kind == "Comment":
+            continue
+        elif token.isdigit():
+            node = Constant(int(token))
+        elif token.isalpha():
+            if token == "fn":
+                node = Function(None)
+            elif token == "let":
+                node = LetStatement(None)
+            elif token == "return":
+                node = ReturnStatement(None)
+            elif kind == "Ident":
+                node = Identifier(token)
+        elif kind == "Ident":
+            node = Identifier(token)
+        elif token == "->":
+            node = Node(T.Arrow)
+        elif token in "+-*/%":
+            optype = [T.Plus, T.Minus, T.Times, T.Divide, T.Modulo]["+-*/%".index(token)]
+            node = Op(optype, None, None)
+        elif token == "(":
+            node = Node(T.LParen)
+            parens.append(i)
+        elif token == ")":
+            node = Node(T.RParen)
+            ptable[parens.pop()] = i
+        elif token == "{":
+            node = Node(T.LBrace)
+            braces.append(i)
+        elif token == "}":
+            node = Node(T.RBrace)
+            btable[braces.pop()] = i
+        elif token == ",":
+            node = Node(T.Comma)
+        elif token == "=":
+            node = Node(T.Assign)
+        else:
+            node = Node(None)
+        node.token = str(token)
+        node.ti = i
+        tokens.append(node)
+        i += 1
+    tokens.append(Node(T.EOF))
+    return tokens
+
+
+@case("tokenizer_baseline")
+def tokenizer_baseline_case(scale):
+    code = generated_script(20000 * scale)
+    ntokens = len(baseline_tokenizer(code))
+    assert ntokens == len(Parser(code).tokenizer(code))
+    return (lambda: baseline_tokenizer(code)), ntokens, "tokens"
+
+
+@case("parser")
+def parser_case(scale):
+    code = generated_script(20000 * scale)
+    return (lambda: Parser(code).parse()), 20000 * scale, "statements"
+
+
+def eval_case(backend):
+    def make(scale):
+        code = """let square = fn(x) -> x * x
+let norm = fn(a, b, c) -> square(a) + square(b) + square(c)
+let x = norm(i, i + 1, i + 2) % 1000
+let y = x * 3 - (x + i) / 7
+return norm(x, y, i) - x * y"""
+        interpreter = Interpreter(code, backend)
+        bindings = {"i": 12}
+        return (lambda: interpreter.run(bindings)), 1, "runs"
+
+    return make
+
+
+for backend in backends:
+    case("eval_" + backend)(eval_case(backend))
+
+
+@case("deep_recursion")
+def deep_recursion_case(scale):
+    # only the vm is not bounded by the python stack
+    depth = 20000 * scale
+    code = """let sum = fn(n) -> {
+    let next = pick(n, recurse, stop)
+    return next(n) + 0
+}
+let recurse = fn(n) -> n + sum(n - 1)
+let stop = fn(n) -> 0
+return sum(depth)"""
+    interpreter = Interpreter(code, "vm")
+    bindings = {"pick": lambda n, a, b: a if n > 0 else b, "depth": depth}
+    return (lambda: interpreter.run(bindings)), 2 * depth, "calls"
+
+
+@case("many_arguments")
+def many_arguments_case(scale):
+    names = ["a{}".format(i) for i in range(64)]
+    code = "let f = fn({}) -> {}\n".format(", ".join(names), " + ".join(names))
+    code += "let g = fn(x) -> f({})\n".format(", ".join("x + {}".format(i) for i in range(64)))
+    code += "return {}".format(" + ".join("g({})".format(i) for i in range(50)))
+    interpreter = Interpreter(code)
+    return (lambda: interpreter.run()), 100, "calls"
+
+
+@case("large_script")
+def large_script_case(scale):
+    # the whole way from a source string to its value, without a cache
+    statements = 20000 * scale
+    code = generated_script(statements)
+    return (lambda: Interpreter(code).run()), statements, "statements"
+
+
+def arithmetic_script(statements):
+    """a script of that many lets, each computed from the one before it"""
+    lines = ["let x0 = 1"]
+    lines += ["let x{} = x{} * {} + {} % (x{} + 7)".format(i, i - 1, i % 5, i, i - 1) for i in range(1, statements)]
+    return "\n".join(lines)
+
+
+@case("flat_load")
+def flat_load_case(scale):
+    # a FlatTree read back from its bytes, which it keeps rather than copying
+    interpreter = Interpreter(arithmetic_script(10000 * scale), "flat")
+    data = interpreter.flat.to_bytes()
+    return (lambda: FlatTree.from_buffer(data)), len(interpreter.flat), "nodes"
+
+
+@case("flat_run")
+def flat_run_case(scale):
+    statements = 10000 * scale
+    interpreter = Interpreter(arithmetic_script(statements), "flat")
+    flat = interpreter.flat
+    return (lambda: flat.run(interpreter.global_frame(None))), statements, "statements"
+
+
+def calls_script(statements):
+    """a script of that many statements, all but the first calling the function it declares"""
+    lines = ["let f = fn(a, b) -> a * b + 1", "let x0 = 1"]
+    lines += ["let x{} = f(x{}, {}) % 1000 - {}".format(i, i - 1, i % 7, i % 3) for i in range(1, statements - 1)]
+    return "\n".join(lines)
+
+
+@case("vm_start")
+def vm_start_case(scale):
+    # a cold start on the vm from source, to compare image_start to
+    statements = 10000 * scale
+    code = calls_script(statements)
+    return (lambda: Interpreter(code, "vm").run()), statements, "statements"
+
+
+@case("image_start")
+def image_start_case(scale):
+    # a cold start from a ProgramImage mapped from a file, in a directory removed along with the case
+    statements = 10000 * scale
+    directory = tempfile.TemporaryDirectory()
+    ProgramImage.compile(calls_script(statements)).save(os.path.join(directory.name, "script.sparki"))
+
+    def run():
+        with ProgramImage.open(os.path.join(directory.name, "script.sparki")) as image:
+            image.run()
+
+    return run, statements, "statements"
+
+
+def measure(name, scale=1, repeat=5):
+    """runs one case, repeat times for at least 0.2 s each, returns its result with the best time.
+    Peak memory is measured on one more run, tracing allocations slows everything down several times"""
+    run, ops, unit = cases[name](scale)
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat, number)) / number
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"unit": unit, "ops": ops, "seconds": seconds, "ops_per_sec": ops / seconds, "peak_bytes": peak}
+
+
+def run_all(names=None, scale=1, repeat=5, file=None):
+    """runs the cases named, every one by default, and returns the results as a dict that dumps to json"""
+    results = OrderedDict()
+    for name in names or cases:
+        if name not in cases:
+            raise ValueError("Unknown benchmark {!r}, expected one of {}".format(name, tuple(cases)))
+        results[name] = result = measure(name, scale, repeat)
+        print(
+            "{:<18} {:>14,.0f} {}/s  peak {:>13,} bytes".format(name, result["ops_per_sec"], result["unit"], result["peak_bytes"]),
+            file=file,
+        )
+    return {"python": platform.python_version(), "scale": scale, "results": results}
+
+
+def compare(baseline, current, threshold=0.1):
+    """The regressions of current against baseline, both as returned by run_all: every case that has lost
+    more than threshold of its ops per second or grown its peak memory by more than threshold,
+    as (name, metric, before, after) tuples. Cases missing from either are not compared"""
+    if baseline.get("scale") != current.get("scale"):
+        raise ValueError("runs at scale {} and {} cannot be compared".format(baseline.get("scale"), current.get("scale")))
+    regressions = []
+    for name, after in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        if after["ops_per_sec"] < before["ops_per_sec"] * (1 - threshold):
+            regressions.append((name, "ops_per_sec", before["ops_per_sec"], after["ops_per_sec"]))
+        if after["peak_bytes"] > before["peak_bytes"] * (1 + threshold):
+            regressions.append((name, "peak_bytes", before["peak_bytes"], after["peak_bytes"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sparkle.bench", description="Benchmarks of the Sparkle interpreter")
+    parser.add_argument("names", nargs="*", help="the cases to run, all of them by default: " + ", ".join(cases))
+    parser.add_argument("-o", "--output", help="write the results to this json file")
+    parser.add_argument("-c", "--compare", help="a json file of earlier results to check these against")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1, help="the change that counts as a regression")
+    parser.add_argument("-s", "--scale", type=int, default=1, help="multiplies the size of the scripts")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    current = run_all(args.names, args.scale, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for name, metric, before, after in regressions:
+            print("regression: {} {} {:,.0f} -> {:,.0f} ({:+.1%})".format(name, metric, before, after, after / before - 1))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
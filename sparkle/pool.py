@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# @File Name: sparkle/pool.py
+# runs many independent Sparkle scripts on a pool of worker processes
+
+import asyncio
+import os
+import pickle
+import timeit
+from concurrent.futures import ProcessPoolExecutor
+
+from sparkle import Interpreter, ProgramCache, LimitExceeded
+
+
+class JobError(Exception):
+    """What a job raised in its worker, with what is needed to report it, since the exception itself may not pickle.
+    kind is the name of the exception class, for a SyntaxError line and column are set
+    and for a LimitExceeded, limit, steps, depth and slots"""
+
+    def __init__(self, kind, message, details=None):
+        super(JobError, self).__init__("{}: {}".format(kind, message))
+        self.kind = kind
+        self.message = message
+        self.details = details or {}
+
+    def __reduce__(self):
+        return JobError, (self.kind, self.message, self.details)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["details"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @classmethod
+    def from_exception(cls, e):
+        details = {}
+        if isinstance(e, SyntaxError):
+            details = {"line": e.lineno, "column": e.offset}
+        elif isinstance(e, LimitExceeded):
+            details = {"limit": e.limit, "steps": e.steps, "depth": e.depth, "slots": e.slots}
+        return cls(type(e).__name__, str(e), details)
+
+
+# the state of a worker process, set up once by _start so every job it runs shares the warm cache
+_worker = {}
+
+
+def _start(backend, cache_size, limits):
+    _worker["cache"] = ProgramCache(cache_size)
+    _worker["backend"] = backend
+    _worker["limits"] = limits
+
+
+def _run(job):
+    """runs one (source, globals) job in a worker, returns its result or the JobError it raised"""
+    source, bindings = job
+    try:
+        value = Interpreter(source, _worker["backend"], cache=_worker["cache"], limits=_worker["limits"]).run(bindings)
+        if type(value) not in (int, float, bool, type(None)):
+            # functions and other values from the host have to make it back through a pipe
+            pickle.dumps(value)
+    except Exception as e:
+        return JobError.from_exception(e)
+    return value
+
+
+def _run_chunk(jobs):
+    return [_run(job) for job in jobs]
+
+
+class Pool:
+    """A pool of worker processes running (source, globals) jobs, globals being the bindings of Interpreter.run.
+    Every worker keeps a ProgramCache of cache_size scripts, so a source it has seen before is not parsed again.
+    A job that raises gives a JobError in place of its result, which is returned rather than raised.
+    globals have to pickle to reach the workers, so host functions among them have to be defined at module level"""
+
+    def __init__(self, processes=None, backend="tree", cache_size=256, limits=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.processes, initializer=_start, initargs=(backend, cache_size, limits))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def submit(self, source, globals_=None):
+        """runs one job, returns a concurrent.futures.Future of its result"""
+        return self.executor.submit(_run, (source, globals_))
+
+    def map(self, jobs, chunksize=64):
+        """runs an iterable of (source, globals) jobs, blocks until they are all done and returns their results in order.
+        Jobs go to the workers chunksize at a time, which is what keeps the cost of the pipes down"""
+        jobs = list(jobs)
+        chunks = [jobs[i : i + chunksize] for i in range(0, len(jobs), chunksize)]
+        results = []
+        for chunk in self.executor.map(_run_chunk, chunks):
+            results += chunk
+        return results
+
+    async def run(self, source, globals_=None):
+        """runs one job without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(source, globals_))
+
+    async def map_async(self, jobs, chunksize=64):
+        """map for asyncio, the event loop keeps running while the workers do"""
+        jobs = list(jobs)
+        chunks = [jobs[i : i + chunksize] for i in range(0, len(jobs), chunksize)]
+        done = await asyncio.gather(*(asyncio.wrap_future(self.executor.submit(_run_chunk, chunk)) for chunk in chunks))
+        return [result for chunk in done for result in chunk]
+
+
+def bench_pool(njobs=4000, sources=50, processes=None):
+    """Scripts per second of map for every number of processes from 1 up to processes, every core by default.
+    The jobs cycle through a few distinct sources, so the workers mostly hit their warm caches"""
+    programs = [
+        "let f = fn(a, b) -> {{ return a * b + {0} }}\nreturn f(x, {0}) - x % 7".format(i) for i in range(sources)
+    ]
+    jobs = [(programs[i % sources], {"x": i}) for i in range(njobs)]
+    expected = [(i * (i % sources) + i % sources) - i % 7 for i in range(njobs)]
+    results = {}
+    for n in range(1, (processes or os.cpu_count() or 1) + 1):
+        with Pool(n) as pool:
+            pool.map(jobs[: n * 64])  # starts the workers
+            start = timeit.default_timer()
+            assert pool.map(jobs) == expected
+            seconds = timeit.default_timer() - start
+        results[n] = njobs / seconds
+        print("{:>3} processes: {:.0f} scripts/s".format(n, njobs / seconds))
+    return results
+
+
+if __name__ == "__main__":
+    bench_pool()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+# @File Name: sparkle/stream.py
+# runs Sparkle statements as they arrive, from a pipe, a file or a prompt
+
+import sys
+
+from sparkle import (
+    NORETURN,
+    Interpreter,
+    Optimizer,
+    Parser,
+    Resolver,
+    T,
+    TailCall,
+    call,
+    children,
+    Function,
+    Identifier,
+    GLOBAL,
+    position,
+    tokenize,
+)
+
+# tokens no statement can end with, a line ending with one of them leaves the statement open
+open_tokens = {T.Let, T.Fn, T.Comma, T.LParen, T.LBrace, T.Function, T.Plus, T.Minus, T.Times, T.Divide, T.Modulo, T.Assign}
+
+
+class Stream:
+    """Runs a script a statement at a time on the tree backend, each top level statement as soon as it is complete,
+    with the globals kept from one to the next. Text is fed in with feed, in chunks of any size, and only the
+    statement being read is held on to, so a stream can go on for any number of statements.
+    A statement is complete at the end of a line where it parses, so one that goes on over several lines has to
+    leave something open, a brace, a parenthesis or an operator, at the end of every line but its last.
+    Only a line that closes every bracket and does not end with an operator is parsed with the lines before it,
+    so a statement of many lines is parsed about once, and an error in one is raised at the first line it could end on.
+    A top level return ends the stream, its value is in value, after which done is True.
+    bindings and limits are those of Interpreter.run and Interpreter, limits count over the whole stream"""
+
+    def __init__(self, bindings=None, optimize=True, limits=None):
+        self.bindings = dict(bindings or {})
+        self.optimize = optimize
+        self.limits = limits
+        # the global scope stays open in the resolver, so every statement sees the globals of those before it
+        self.resolver = Resolver()
+        self.resolver.push_function()
+        self.interpreter = Interpreter("", limits=limits)
+        self.globals = [None]
+        self.bound = set()
+        # the lines read of the statement that is not complete yet, and the text after the last newline
+        self.pending = ""
+        self.partial = ""
+        # brackets left open by pending and whether its last token leaves it open, see scan
+        self.depth = 0
+        self.open = False
+        # lines read before pending, its first line is the one after them
+        self.lines = 0
+        self.done = False
+        self.value = None
+        if limits is not None:
+            limits.reset()
+
+    def feed(self, text):
+        """adds text to what has been read, runs every statement it completes and returns their values,
+        see run_statement"""
+        if self.done:
+            raise RuntimeError("the stream has returned")
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        values = []
+        for line in lines:
+            self.pending += line + "\n"
+            if not self.scan(line):
+                continue
+            statements = self.parse(self.pending)
+            if statements is not None:
+                self.lines += self.pending.count("\n")
+                self.clear()
+                values += self.run_statements(statements)
+                if self.done:
+                    break
+        return values
+
+    def close(self):
+        """runs what is left at the end of the input, which has to be complete"""
+        text = self.pending + self.partial
+        self.clear()
+        self.partial = ""
+        if self.done or not text.strip():
+            return []
+        return self.run_statements(self.parse(text, final=True))
+
+    def clear(self):
+        """forgets pending, once it has run or failed"""
+        self.pending = ""
+        self.depth = 0
+        self.open = False
+
+    def scan(self, line):
+        """follows the brackets and the last token of pending, which line was just added to,
+        and tells whether pending may be complete now, only the new line is lexed"""
+        try:
+            tokens = list(tokenize(line))
+        except SyntaxError:
+            # parsing pending raises it with the right line
+            return True
+        if len(tokens) == 1:
+            # nothing but whitespace and comments, which cannot complete what the lines before did not
+            return False
+        for token in tokens:
+            kind = token[0]
+            if kind is T.LParen or kind is T.LBrace:
+                self.depth += 1
+            elif kind is T.RParen or kind is T.RBrace:
+                self.depth -= 1
+        self.open = tokens[-2][0] in open_tokens
+        # an unbalanced closing bracket cannot parse either, and is parsed right away for its error
+        return self.depth < 0 or (not self.depth and not self.open)
+
+    def parse(self, code, final=False):
+        """the statements of code, or None if the last of them is not complete yet"""
+        try:
+            root = Parser(code).parse()
+        except SyntaxError as e:
+            if not final and (e.lineno, e.offset) == position(code, len(code)):
+                # ran into the end of the input, the statement goes on in the next line
+                return None
+            if not self.lines:
+                raise
+            # code starts after the lines already read, the error is moved to its line in the whole stream
+            line = e.lineno + self.lines
+            message = e.msg.replace("at line {} ".format(e.lineno), "at line {} ".format(line), 1)
+            raise SyntaxError(message, (e.filename, line, e.offset, e.text)) from None
+        if self.optimize:
+            root = Optimizer().optimize(root)
+        return root.statements
+
+    def run_statements(self, statements):
+        values = []
+        for statement in statements:
+            values.append(self.run_statement(statement))
+            if self.done:
+                break
+        return values
+
+    def run_statement(self, statement):
+        """Resolves statement against the globals so far and runs it, returns the value of an expression
+        statement or a return and None for the rest"""
+        resolver = self.resolver
+        statement.visit(resolver)
+        frame = self.globals
+        # the global frame grows in place, closures made by earlier statements hold on to it
+        grown = resolver.nslots[0] - len(frame)
+        if grown > 0:
+            frame += [None] * grown
+            if self.limits is not None:
+                self.limits.slots += grown
+                if self.limits.slots > self.limits.max_slots:
+                    self.limits.exceeded("slots", self.limits.max_slots)
+        symbols = resolver.functions[0][0]
+        for name, value in self.bindings.items():
+            if name not in self.bound and name in symbols:
+                frame[symbols[name]] = value
+                self.bound.add(name)
+        self.check_names(statement)
+        interpreter = self.interpreter
+        interpreter.globals = interpreter.frame = frame
+        value = statement.run(interpreter)
+        if type(value) is TailCall:
+            value = call(interpreter, value.callee, value.args)
+        if statement.op is T.Return or (statement.op is T.Block and value is not NORETURN):
+            self.done = True
+            self.value = value
+            return value
+        if statement.op in (T.Let, T.Block):
+            return None
+        return value
+
+    def check_names(self, statement):
+        """raises NameError for a global this statement reads outside of functions that nothing has bound,
+        a function body may still use globals that later statements declare"""
+        free = set(self.resolver.free_globals()) - self.bound
+        if not free:
+            return
+        stack = [statement]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Identifier) and node.depth in (0, GLOBAL) and node.identifier in free:
+                raise NameError("name {!r} is not defined".format(node.identifier))
+            if not isinstance(node, Function):
+                stack.extend(children(node))
+
+    def recover(self):
+        """after a statement raised, gets back to the global frame so the stream can go on"""
+        self.lines += self.pending.count("\n")
+        self.clear()
+        self.partial = ""
+        self.interpreter.frame = self.globals
+        if self.limits is not None:
+            self.limits.depth = 0
+            self.limits.slots = len(self.globals) - 1
+
+
+def run(file, bindings=None, optimize=True, limits=None):
+    """runs the statements read from file, line by line, returns the value of its top level return if it has one"""
+    stream = Stream(bindings, optimize, limits)
+    for line in file:
+        stream.feed(line)
+        if stream.done:
+            return stream.value
+    stream.close()
+    return stream.value
+
+
+def repl(bindings=None, input=sys.stdin, output=sys.stdout):
+    """Reads statements from input, prompting on output, printing the value of every expression statement
+    and every error, going on after those. Ends at the end of input or with a top level return"""
+    stream = Stream(bindings)
+    prompt = "> "
+    while not stream.done:
+        output.write(prompt)
+        output.flush()
+        line = input.readline()
+        if not line:
+            break
+        try:
+            values = stream.feed(line)
+        except Exception as e:
+            print("{}: {}".format(type(e).__name__, e), file=output)
+            stream.recover()
+            prompt = "> "
+            continue
+        prompt = "... " if stream.pending else "> "
+        for value in values:
+            if value is not None:
+                print(repr(value), file=output)
+    return stream.value
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            value = run(f)
+    elif sys.stdin.isatty():
+        value = repl()
+    else:
+        value = run(sys.stdin)
+    if value is not None:
+        print(repr(value))